@@ -0,0 +1,196 @@
+"""Latency, throughput and recall benchmark for the memory_tools knowledge-base tools.
+
+Builds throwaway memory-mapped indexes from a labelled corpus with a deterministic hashing
+embedder (no Ollama, Jina or Pinecone calls), points memory_tools at them and replays a query
+set against `past_successful_example`, `what_human_would_do` and `rag_agent_tool`.
+
+    python benchmark_memory_tools.py --corpus corpus.jsonl --queries queries.jsonl --out bench.jsonl
+
+corpus.jsonl:  {"id": "...", "store": "fd" | "knowledge" | "rag", "text": "...", "metadata": {...}}
+queries.jsonl: {"query": "...", "relevant_ids": ["...", ...]}
+
+One JSON record per (tool, concurrency) with p50/p95/p99 latency and throughput, and one per
+tool with recall@k, is printed and, with --out, appended to the given file. Recall is measured on
+the documents a tool actually returns, i.e. after the ContextAssembler's cutoff, de-duplication
+and token budget. Tools whose store has no records in the corpus are skipped.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+from hybrid_retriever import HybridRetriever
+from mmap_index import LazyIndex, write_mmap_index
+from snippets import render_human_instruction, render_past_example
+
+# tool name -> (corpus store, k the tool retrieves)
+TOOLS = {
+    "past_successful_example": ("fd", 5),
+    "what_human_would_do": ("knowledge", 2),
+    "rag_agent_tool": ("rag", 10),
+}
+RENDERERS = {"fd": render_past_example, "knowledge": render_human_instruction, "rag": None}
+# store -> (memory_tools assembler, header) the tool renders its hits with
+ASSEMBLERS = {"fd": ("past_example_assembler", "PAST_EXAMPLE_HEADER"),
+              "knowledge": ("human_instruction_assembler", "HUMAN_INSTRUCTION_HEADER")}
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic stand-in embedder: hashed word unigrams and bigrams, L2 normalised."""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> list[float]:
+        tokens = re.findall(r"\w+", text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def load_jsonl(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_indexes(corpus: list[dict], embedder: Embeddings, root: str) -> dict:
+    """Writes one index per store that has records; returns store -> index path."""
+    paths = {}
+    for store, render in RENDERERS.items():
+        records = [r for r in corpus if r["store"] == store]
+        if not records:
+            continue
+        documents = [Document(page_content=r["text"], metadata=r.get("metadata", {})) for r in records]
+        paths[store] = os.path.join(root, store)
+        write_mmap_index(paths[store], embedder.embed_documents([r["text"] for r in records]), documents,
+                         [r["id"] for r in records], render=render)
+    return paths
+
+
+def install(memory_tools, paths: dict, embedder: Embeddings):
+    """Points the memory_tools globals at the benchmark indexes and embedder. Stores missing from
+    `paths` are left alone."""
+    memory_tools.embeddings = CachedEmbeddings(embedder, memory_tools.embedding_cache, "benchmark/hash")
+    if "fd" in paths:
+        memory_tools.fd_store = LazyIndex(paths["fd"], memory_tools.embeddings, mmap_path=paths["fd"])
+    if "knowledge" in paths:
+        memory_tools.knowledge_store = LazyIndex(paths["knowledge"], memory_tools.embeddings, mmap_path=paths["knowledge"])
+    if "rag" in paths:
+        memory_tools.RAG_BACKEND = "local"
+        memory_tools.retriever_registry.swap(memory_tools.RAG_INDEX_NAME,
+                                             HybridRetriever.load(paths["rag"], embed_fn=embedder.embed_query))
+
+
+def reset_caches(memory_tools):
+    memory_tools.embedding_cache.clear()
+    memory_tools.past_example_cache.invalidate()
+    memory_tools.human_instruction_cache.invalidate()
+
+
+def run_latency(tool, queries: list[str], concurrency: int) -> dict:
+    def timed(query):
+        start = time.perf_counter()
+        tool(query, thought="benchmark")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        latencies = np.asarray(list(pool.map(timed, queries))) * 1000
+        wall = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "throughput_qps": len(queries) / wall, "requests": len(queries)}
+
+
+def returned_ids(memory_tools, store: str, query: str, k: int) -> list[str]:
+    """Ids of the documents the tool returns for `query`: rag_agent_tool returns every retrieved
+    node, the knowledge-base tools only what their assembler selects from the top k hits."""
+    if store == "rag":
+        nodes = memory_tools.retriever_registry.get(memory_tools.RAG_INDEX_NAME).retrieve(query)
+        return [node.node.node_id for node in nodes]
+    index = memory_tools.fd_store if store == "fd" else memory_tools.knowledge_store
+    assembler, header = ASSEMBLERS[store]
+    results = index.similarity_search_with_score_by_vector(memory_tools.embeddings.embed_query(query), k=k)
+    return [doc.id for doc in getattr(memory_tools, assembler).select(results, header=getattr(memory_tools, header))]
+
+
+def run_recall(memory_tools, store: str, k: int, labelled: list[dict], store_ids: set) -> dict:
+    recalls = []
+    for record in labelled:
+        relevant = set(record.get("relevant_ids", [])) & store_ids
+        if not relevant:
+            continue
+        recalls.append(len(relevant & set(returned_ids(memory_tools, store, record["query"], k))) / len(relevant))
+    return {"k": k, f"recall@{k}": float(np.mean(recalls)) if recalls else None, "labelled_queries": len(recalls)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the memory_tools retrieval tools offline.")
+    parser.add_argument("--corpus", required=True)
+    parser.add_argument("--queries", required=True)
+    parser.add_argument("--tools", nargs="*", default=list(TOOLS), choices=list(TOOLS))
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16])
+    parser.add_argument("--repeat", type=int, default=1, help="replay the query set this many times per run")
+    parser.add_argument("--warm", action="store_true", help="keep embedding/result caches between runs")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--max-distance", type=float, default=None,
+                        help="relevance cutoff for the knowledge-base tools; off by default because the hashing "
+                             "embedder's distances are not comparable to the production model's")
+    parser.add_argument("--out", help="append results to this JSONL file")
+    args = parser.parse_args(argv)
+
+    import memory_tools
+
+    corpus = load_jsonl(args.corpus)
+    labelled = load_jsonl(args.queries)
+    queries = [r["query"] for r in labelled] * args.repeat
+    embedder = HashEmbeddings(args.dim)
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "corpus": args.corpus, "queries": args.queries}
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = build_indexes(corpus, embedder, root)
+        install(memory_tools, paths, embedder)
+        for assembler, _ in ASSEMBLERS.values():
+            getattr(memory_tools, assembler).max_distance = args.max_distance
+        results = []
+        for name in args.tools:
+            store, k = TOOLS[name]
+            if store not in paths:
+                print(f"skipping {name}: no '{store}' records in the corpus", file=sys.stderr)
+                continue
+            tool = getattr(memory_tools, name)
+            for concurrency in args.concurrency:
+                if not args.warm:
+                    reset_caches(memory_tools)
+                results.append({**run, "tool": name, "metric": "latency", "concurrency": concurrency,
+                                **run_latency(tool, queries, concurrency)})
+            store_ids = {r["id"] for r in corpus if r["store"] == store}
+            results.append({**run, "tool": name, "metric": "recall",
+                            **run_recall(memory_tools, store, k, labelled, store_ids)})
+
+    lines = [json.dumps(result) for result in results]
+    print("\n".join(lines))
+    if args.out:
+        with open(args.out, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
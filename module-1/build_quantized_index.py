@@ -0,0 +1,103 @@
+"""Offline builder for IVF / product-quantized versions of the FAISS knowledge stores.
+
+Evaluates every `--factory` x `--nprobe` combination against the exact flat index on a held-out
+sample of the corpus and prints one JSON report line per combination (recall@k, index size,
+search latency). With `--out`, the chosen configuration is trained on the full corpus and saved
+as a regular langchain FAISS store, so `FAISS.load_local` / `LazyIndex` can serve it as is
+(leave out the `.mmap` conversion for such stores, it is exact/flat only).
+
+    python build_quantized_index.py <faiss_dir> --factory IVF256,Flat IVF256,PQ64 --nprobe 4 16 64
+    python build_quantized_index.py <faiss_dir> --factory IVF256,PQ64 --nprobe 16 --out <faiss_dir>_ivfpq
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+import faiss
+import numpy as np
+
+
+def default_factories(n: int, dim: int) -> list[str]:
+    nlist = max(1, min(4096, int(4 * math.sqrt(n))))
+    m = next(m for m in (64, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+    return [f"IVF{nlist},Flat", f"IVF{nlist},PQ{m}", f"PQ{m}"]
+
+
+def build_index(factory: str, vectors: np.ndarray, nprobe: int):
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    if nprobe and "IVF" in factory:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    return index
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(e[:k])) for a, e in zip(approx_ids, exact_ids))
+    return hits / (k * len(exact_ids))
+
+
+def index_bytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def evaluate(vectors: np.ndarray, factories: list[str], nprobes: list[int], k: int, holdout: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    queries, base = vectors[order[:holdout]], vectors[order[holdout:]]
+
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    start = time.perf_counter()
+    _, exact_ids = exact.search(queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    yield {"factory": "Flat", "nprobe": None, "k": k, "recall": 1.0,
+           "bytes": index_bytes(exact), "ms_per_query": exact_ms}
+
+    for factory in factories:
+        index = build_index(factory, base, None)
+        size = index_bytes(index)
+        for nprobe in (nprobes if "IVF" in factory else [None]):
+            if nprobe:
+                faiss.extract_index_ivf(index).nprobe = nprobe
+            start = time.perf_counter()
+            _, ids = index.search(queries, k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            yield {"factory": factory, "nprobe": nprobe, "k": k, "recall": recall_at_k(ids, exact_ids, k),
+                   "bytes": size, "ms_per_query": ms}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("faiss_dir", help="langchain FAISS store directory (index.faiss + index.pkl)")
+    parser.add_argument("--factory", nargs="*", help="faiss index_factory strings, e.g. IVF256,PQ64")
+    parser.add_argument("--nprobe", nargs="*", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--holdout", type=int, default=200, help="corpus vectors held out as queries")
+    parser.add_argument("--out", help="save the (single) chosen factory/nprobe as a FAISS store here")
+    args = parser.parse_args(argv)
+    from langchain_community.vectorstores import FAISS
+
+    # embeddings are not needed to read or rewrite the stored vectors
+    store = FAISS.load_local(args.faiss_dir, None, allow_dangerous_deserialization=True)
+    vectors = store.index.reconstruct_n(0, store.index.ntotal).astype(np.float32)
+    factories = args.factory or default_factories(len(vectors), vectors.shape[1])
+    holdout = min(args.holdout, max(1, len(vectors) // 10))
+
+    for report in evaluate(vectors, factories, args.nprobe, args.k, holdout):
+        print(json.dumps(report))
+
+    if args.out:
+        if len(factories) != 1 or len(args.nprobe) != 1:
+            sys.exit("--out needs exactly one --factory and one --nprobe")
+        # trained on the full corpus; row order (and so index_to_docstore_id) is unchanged
+        store.index = build_index(factories[0], vectors, args.nprobe[0])
+        store.save_local(args.out)
+        print(f"saved {factories[0]} (nprobe={args.nprobe[0]}) to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
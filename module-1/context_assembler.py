@@ -0,0 +1,61 @@
+import re
+from typing import Optional
+
+from snippets import count_tokens, get_snippet, get_snippet_tokens
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextAssembler:
+    """Chooses which retrieved documents a knowledge-base tool returns.
+
+    Hits are taken best first. A hit is dropped when its distance is above `max_distance`, or
+    when its snippet is a near duplicate (word 3-shingle Jaccard >= `duplicate_threshold`) of one
+    already chosen. Hits are added while they fit in `token_budget` (measured with the snippet
+    token counts stored at index-build time); the best remaining hit is always kept, so the top
+    evidence survives even a tight budget.
+    """
+
+    def __init__(self, render, token_budget: int = 1500, max_distance: Optional[float] = None,
+                 duplicate_threshold: float = 0.8):
+        self.render = render
+        self.token_budget = token_budget
+        self.max_distance = max_distance
+        self.duplicate_threshold = duplicate_threshold
+
+    def select(self, results, header: str = "", seen: Optional[list] = None, budget: Optional[int] = None) -> list:
+        """Returns the chosen documents from `(doc, distance)` results.
+
+        `seen` carries (id, shingles) of documents chosen earlier (e.g. for previous queries of a
+        batch) and is extended with this call's choices.
+        """
+        seen = seen if seen is not None else []
+        budget = (self.token_budget if budget is None else budget) - count_tokens(header)
+        selected, used = [], 0
+        for doc, distance in results:
+            if self.max_distance is not None and distance > self.max_distance:
+                continue
+            shingles = _shingles(get_snippet(doc, self.render))
+            if any((doc.id is not None and doc.id == doc_id) or _jaccard(shingles, other) >= self.duplicate_threshold
+                   for doc_id, other in seen):
+                continue
+            tokens = get_snippet_tokens(doc, self.render)
+            if selected and used + tokens > budget:
+                continue
+            selected.append(doc)
+            seen.append((doc.id, shingles))
+            used += tokens
+        return selected
@@ -0,0 +1,167 @@
+import array
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Normalization applied before keying, so trivially different spellings of a query share an entry.
+
+    Case is kept: the embedding models are case-sensitive ("UPI" and "upi" embed differently).
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Two tier embedding cache keyed by (model, normalized text).
+
+    The in-memory tier is a bounded LRU. If `path` is given, entries are also written to
+    a sqlite file so they survive restarts; disk hits are promoted into memory.
+    """
+
+    def __init__(self, max_items: int = 10000, path: Optional[str] = None):
+        self.max_items = max_items
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            self._conn.commit()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                       "lookup_seconds": 0.0, "embed_seconds": 0.0, "embed_calls": 0}
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        start = time.perf_counter()
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+            elif self._conn is not None:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array.array("f", row[0]).tolist()
+                    self._put_memory(key, vector)
+                    self._stats["disk_hits"] += 1
+            if vector is None:
+                self._stats["misses"] += 1
+            self._stats["lookup_seconds"] += time.perf_counter() - start
+        return vector
+
+    def put(self, model: str, text: str, vector: list[float]):
+        key = self.make_key(model, text)
+        with self._lock:
+            self._put_memory(key, list(vector))
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   (key, array.array("f", vector).tobytes()))
+                self._conn.commit()
+
+    async def aget(self, model: str, text: str) -> Optional[list[float]]:
+        """`get` for coroutines: with a disk tier the sqlite lookup runs in a worker thread."""
+        if self._conn is None:
+            return self.get(model, text)
+        return await asyncio.to_thread(self.get, model, text)
+
+    async def aput(self, model: str, text: str, vector: list[float]):
+        if self._conn is None:
+            return self.put(model, text, vector)
+        return await asyncio.to_thread(self.put, model, text, vector)
+
+    def _put_memory(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def record_embed(self, seconds: float, calls: int = 1):
+        with self._lock:
+            self._stats["embed_seconds"] += seconds
+            self._stats["embed_calls"] += calls
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["avg_embed_seconds"] = stats["embed_seconds"] / stats["embed_calls"] if stats["embed_calls"] else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps a langchain `Embeddings` so every query/document embedding goes through an `EmbeddingCache`."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            start = time.perf_counter()
+            vector = self.embeddings.embed_query(text)
+            self.cache.record_embed(time.perf_counter() - start)
+            self.cache.put(self.model_name, text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = await self.cache.aget(self.model_name, text)
+        if vector is None:
+            start = time.perf_counter()
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.record_embed(time.perf_counter() - start)
+            await self.cache.aput(self.model_name, text, vector)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_many(f"{self.model_name}/document", texts)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embeds several queries with one request for the cache misses.
+
+        Misses go through the wrapped model's batch (document) endpoint, which only matches
+        `embed_query` for symmetric models such as mxbai-embed-large served by Ollama.
+        """
+        return self._embed_many(self.model_name, texts)
+
+    def _embed_many(self, cache_model: str, texts: list[str]) -> list[list[float]]:
+        vectors = [self.cache.get(cache_model, text) for text in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            start = time.perf_counter()
+            new_vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.record_embed(time.perf_counter() - start)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+                self.cache.put(cache_model, texts[i], vector)
+        return vectors
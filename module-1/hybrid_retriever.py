@@ -0,0 +1,125 @@
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Optional, Union
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from mmap_index import MmapIndex, write_mmap_index
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.count = len(texts)
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = np.zeros(self.count, dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+        avg_length = float(doc_lengths.mean()) if self.count else 0.0
+        # per document length normalisation is folded in once at build time
+        self._norm = k1 * (1 - b + b * doc_lengths / (avg_length or 1.0))
+        self._postings = {}
+        for term, (doc_ids, tfs) in postings.items():
+            idf = math.log(1 + (self.count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            self._postings[term] = (np.asarray(doc_ids, dtype=np.int64), np.asarray(tfs, dtype=np.float32), idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            doc_ids, tfs, idf = self._postings[term]
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[doc_ids])
+        return scores
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+class HybridRetriever:
+    """In-process drop-in for the Pinecone hybrid retriever returned by `get_rag_engine`.
+
+    Keeps a BM25 inverted index next to a dense index (the memory-mapped layout from
+    mmap_index.py) and ranks documents by `alpha * dense + (1 - alpha) * bm25`, both min-max
+    normalised over the candidate set, the same convex fusion Pinecone applies to
+    dense/sparse vectors. `retrieve` returns llama_index `NodeWithScore`s, so callers that
+    read `.text` work unchanged.
+    """
+
+    def __init__(self, index: MmapIndex, embed_fn: Optional[Callable[[str], list[float]]] = None,
+                 similarity_top_k: int = 10, alpha: float = 0.5, candidate_k: int = 100):
+        self.index = index
+        self.embed_fn = embed_fn
+        self.similarity_top_k = similarity_top_k
+        self.alpha = alpha
+        self.candidate_k = candidate_k
+        self.documents = [index.document(i) for i in range(index.count)]
+        self.bm25 = BM25Index([doc.page_content for doc in self.documents])
+
+    @classmethod
+    def load(cls, path: str, embed_fn: Optional[Callable[[str], list[float]]] = None, **kwargs) -> "HybridRetriever":
+        return cls(MmapIndex(path), embed_fn=embed_fn, **kwargs)
+
+    @staticmethod
+    def build(path: str, texts: list[str], vectors, metadatas: Optional[list[dict]] = None):
+        """Writes an index directory that `load` can serve."""
+        from langchain_core.documents import Document
+        metadatas = metadatas or [{} for _ in texts]
+        write_mmap_index(path, vectors, [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+
+    def _query_embedding(self, query: QueryBundle):
+        if query.embedding is not None:
+            return np.asarray(query.embedding, dtype=np.float32)
+        if self.embed_fn is None:
+            return None
+        return np.asarray(self.embed_fn(query.query_str), dtype=np.float32)
+
+    def retrieve(self, query: Union[str, QueryBundle]) -> list[NodeWithScore]:
+        if isinstance(query, str):
+            query = QueryBundle(query_str=query)
+        if self.index.count == 0:
+            return []
+        sparse = self.bm25.scores(query.query_str)
+        embedding = self._query_embedding(query)
+        if embedding is not None:
+            # negative squared L2 distance, so larger is better like the bm25 scores
+            dense = -(self.index.norms - 2.0 * (self.index.vectors @ embedding) + float(embedding @ embedding))
+        else:
+            dense = np.zeros_like(sparse)
+
+        n = min(self.candidate_k, self.index.count)
+        candidates = np.union1d(np.argpartition(-dense, n - 1)[:n], np.argpartition(-sparse, n - 1)[:n])
+        fused = self.alpha * _min_max(dense[candidates]) + (1 - self.alpha) * _min_max(sparse[candidates])
+        top = candidates[np.argsort(-fused)[:self.similarity_top_k]]
+        scores = dict(zip(candidates.tolist(), fused.tolist()))
+
+        results = []
+        for i in top.tolist():
+            doc = self.documents[i]
+            node = TextNode(text=doc.page_content, metadata=doc.metadata, id_=doc.id)
+            results.append(NodeWithScore(node=node, score=scores[i]))
+        return results
+
+    async def aretrieve(self, query: Union[str, QueryBundle]) -> list[NodeWithScore]:
+        return await asyncio.to_thread(self.retrieve, query)
@@ -0,0 +1,117 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Runs `fn` over batches of items submitted concurrently from many threads/coroutines.
+
+    The first waiting item opens a batch; items arriving within `max_wait_ms` (up to
+    `max_batch_size`) join it, and the whole batch goes through one `fn` call on a
+    background thread.
+    """
+
+    def __init__(self, fn: Callable[[list], list], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self._fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats = {"batches": 0, "items": 0}
+        self._thread = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                results = self._fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class LocalEmbeddings(Embeddings):
+    """In-process CPU embeddings through sentence-transformers.
+
+    Single query embeddings from concurrent callers are coalesced by a `MicroBatcher` into one
+    forward pass; `embed_documents` is already a batch and goes straight to the model.
+    `encode_kwargs` are passed to `SentenceTransformer.encode` (e.g. the jina-embeddings-v3
+    task / prompt name).
+
+    With `normalize` (the default) vectors are scaled to unit L2 norm, after any `truncate_dim`,
+    like the Ollama and Jina API embeddings the indexes were built with; distance cutoffs tuned on
+    those (e.g. memory_tools' max distances) only hold on that scale.
+    """
+
+    def __init__(self, model_name: str = "mixedbread-ai/mxbai-embed-large-v1", device: str = "cpu",
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, encode_kwargs: Optional[dict] = None,
+                 normalize: bool = True, **model_kwargs):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device=device, **model_kwargs)
+        self.encode_kwargs = encode_kwargs or {}
+        self.normalize = normalize
+        self.batcher = MicroBatcher(self._encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.asarray(self.model.encode(texts, convert_to_numpy=True, **self.encode_kwargs), dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.batcher.submit(text).result()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.wrap_future(self.batcher.submit(text))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+    def close(self):
+        self.batcher.close()
@@ -1,28 +1,74 @@
 import os
 import sys
+import asyncio
+import atexit
+import threading
+import time
+from typing import Callable
 from dotenv import load_dotenv # add pinecone key and jina ai key in .env file.
 
 from pinecone import Pinecone
 from pydantic import Field
+from langchain_core.tools import StructuredTool
 from llama_index.vector_stores.pinecone import PineconeVectorStore
-from llama_index.core import VectorStoreIndex
+from llama_index.core import VectorStoreIndex, QueryBundle
 from llama_index.embeddings.jinaai import JinaEmbedding
-from langchain_community.vectorstores import FAISS
 from langchain_ollama import OllamaEmbeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from mmap_index import LazyIndex
+from hybrid_retriever import HybridRetriever
+from semantic_cache import SemanticCache
+from snippets import count_tokens, get_snippet, render_past_example, render_human_instruction
+from context_assembler import ContextAssembler
 
 import sys
 sys.path.append('/Users/abhishek.kushwaha/projects/chatAgent/src')
 
-embeddings = OllamaEmbeddings(
-    model='mxbai-embed-large',
-)
-fd_store = FAISS.load_local(
-    "/Users/abhishek.kushwaha/projects/chatAgent/src/data/indexes/FD_resolution", embeddings, allow_dangerous_deserialization=True
-)
+# shared by fd_store, knowledge_store and the jina retriever so one support turn embeds a query only once per model.
+embedding_cache = EmbeddingCache(max_items=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+                                 path=os.getenv("EMBEDDING_CACHE_PATH"))
+atexit.register(embedding_cache.close)
 
-knowledge_store = FAISS.load_local(
-    "/Users/abhishek.kushwaha/projects/chatAgent/src/data/indexes/auto_policy", embeddings, allow_dangerous_deserialization=True
-)
+# "pinecone" or "local"; local serves <LOCAL_RAG_INDEX_DIR>/<index name> in-process with HybridRetriever.
+RAG_BACKEND = os.getenv("RAG_BACKEND", "pinecone")
+# "remote" embeds through Ollama / the Jina API, "local" runs the same models in-process on CPU
+# with dynamic micro-batching of concurrent queries (needs sentence-transformers). Defaults to
+# local with the local RAG backend, so that one does not depend on the Jina API for queries.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local" if RAG_BACKEND == "local" else "remote")
+
+if EMBEDDING_BACKEND == "local":
+    from local_embeddings import LocalEmbeddings
+    # both return unit-norm vectors (LocalEmbeddings' default), the scale of the Ollama / Jina API
+    # vectors the indexes were built with and the max distance cutoffs below assume
+    local_jina_embeddings = LocalEmbeddings("jinaai/jina-embeddings-v3", trust_remote_code=True, truncate_dim=1024,
+                                            encode_kwargs={"task": "retrieval.query", "prompt_name": "retrieval.query"})
+    embeddings = CachedEmbeddings(LocalEmbeddings("mixedbread-ai/mxbai-embed-large-v1"),
+                                  cache=embedding_cache, model_name="local/mxbai-embed-large")
+else:
+    embeddings = CachedEmbeddings(OllamaEmbeddings(
+        model='mxbai-embed-large',
+    ), cache=embedding_cache, model_name="ollama/mxbai-embed-large")
+
+# indexes are opened on first use (memory-mapped when converted with mmap_index.py), so importing
+# this module does not pay for deserializing the corpora. Convert with `--render past_example` /
+# `--render human_instruction` to also store the pre-rendered tool output per document.
+# FD_resolution can instead be a segmented index fed by resolution_ingest.py; fd_store then picks up
+# newly published versions every few seconds.
+FD_RESOLUTION_INDEX_PATH = "/Users/abhishek.kushwaha/projects/chatAgent/src/data/indexes/FD_resolution"
+AUTO_POLICY_INDEX_PATH = "/Users/abhishek.kushwaha/projects/chatAgent/src/data/indexes/auto_policy"
+
+fd_store = LazyIndex(FD_RESOLUTION_INDEX_PATH, embeddings)
+
+knowledge_store = LazyIndex(AUTO_POLICY_INDEX_PATH, embeddings)
+
+# formatted tool output for queries that are near duplicates of a recent one. Entries are
+# tied to the index generation (checked before every lookup), so a newly published version or
+# `fd_store.reload()` / `knowledge_store.reload()` invalidates them.
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.05"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+past_example_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_DISTANCE)
+human_instruction_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_DISTANCE)
 
 load_dotenv("/Users/abhishek.kushwaha/projects/langchain-academy/module-1/.env")
 
@@ -30,21 +76,67 @@ pinecone_api_key = os.getenv("PINECONE_API_KEY")
 jina_ai_api_key = os.getenv("JINA_API_KEY")
 print("here", pinecone_api_key, jina_ai_api_key)
 
-def get_rag_engine(idx_name = "jina-ai-razorpay-payment-unique"):
-    pc = Pinecone(api_key=pinecone_api_key)
-    pinecone_index = pc.Index(idx_name)
+RAG_INDEX_NAME = os.getenv("RAG_INDEX_NAME", "jina-ai-razorpay-payment-unique")
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+# urllib3 keeps this many open connections per host; sized to the async_req thread pool so
+# concurrent queries reuse pooled connections instead of opening and discarding extra ones.
+PINECONE_CONNECTION_POOL_MAXSIZE = int(os.getenv("PINECONE_CONNECTION_POOL_MAXSIZE", str(PINECONE_POOL_THREADS)))
+LOCAL_RAG_INDEX_DIR = os.getenv("LOCAL_RAG_INDEX_DIR", "/Users/abhishek.kushwaha/projects/chatAgent/src/data/indexes/rag")
+
+_pinecone_client = None
+_jina_embeddings = None
+_client_lock = threading.Lock()
+
+
+def _get_clients():
+    """Returns the process-wide Pinecone client and Jina query embedder.
+
+    Both hold pooled HTTP sessions, so every engine built in this process shares them
+    instead of opening a fresh connection per tool call.
+    """
+    global _pinecone_client, _jina_embeddings
+    with _client_lock:
+        if _pinecone_client is None:
+            _pinecone_client = Pinecone(api_key=pinecone_api_key, pool_threads=PINECONE_POOL_THREADS,
+                                        connection_pool_maxsize=PINECONE_CONNECTION_POOL_MAXSIZE)
+        if _jina_embeddings is None:
+            _jina_embeddings = JinaEmbedding(api_key=jina_ai_api_key, 
+                                            model="jina-embeddings-v3", 
+                                            task="retrieval.query",    
+                                            embed_batch_size=2, 
+                                            dimensions=1024 )
+    return _pinecone_client, _jina_embeddings
+
+
+def _close_clients():
+    global _pinecone_client, _jina_embeddings
+    with _client_lock:
+        for client in (_pinecone_client, getattr(_jina_embeddings, "_api", None)):
+            session = getattr(client, "_session", None) or client
+            close = getattr(session, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    print("failed to close client", e)
+        _pinecone_client = None
+        _jina_embeddings = None
+
+
+def get_rag_engine(idx_name = RAG_INDEX_NAME):
+    if RAG_BACKEND == "local":
+        return HybridRetriever.load(os.path.join(LOCAL_RAG_INDEX_DIR, idx_name),
+                                    embed_fn=_jina_query_embedding, similarity_top_k=10)
+
+    pc, jina_embeddings = _get_clients()
+    pinecone_index = pc.Index(idx_name, pool_threads=PINECONE_POOL_THREADS,
+                              connection_pool_maxsize=PINECONE_CONNECTION_POOL_MAXSIZE)
 
     vector_store = PineconeVectorStore(
         pinecone_index=pinecone_index,
         add_sparse_vector=True,
     )
 
-    jina_embeddings = JinaEmbedding(api_key=jina_ai_api_key, 
-                                    model="jina-embeddings-v3", 
-                                    task="retrieval.query",    
-                                    embed_batch_size=2, 
-                                    dimensions=1024 )
-
     index = VectorStoreIndex.from_vector_store(vector_store=vector_store, 
                                                 embed_model=jina_embeddings) 
 
@@ -53,14 +145,175 @@ def get_rag_engine(idx_name = "jina-ai-razorpay-payment-unique"):
     return retriever_engine
 
 
+class RetrieverRegistry:
+    """Process-wide registry of retriever engines keyed by index name.
+
+    Engines are built once and reused by every tool call. `swap` rebuilds an engine
+    (e.g. after the index was re-created) and replaces it atomically, so in-flight
+    calls finish on the old engine while new calls pick up the new one.
+    """
+
+    def __init__(self, builder: Callable = get_rag_engine):
+        self._builder = builder
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def get(self, idx_name: str = RAG_INDEX_NAME):
+        engine = self._engines.get(idx_name)
+        if engine is not None:
+            return engine
+        with self._lock:
+            if idx_name not in self._engines:
+                self._engines[idx_name] = self._builder(idx_name)
+            return self._engines[idx_name]
+
+    def warmup(self, idx_names: list[str], probe_query: str = ""):
+        """Builds engines ahead of the first request. A probe query also opens the
+        pooled connections and primes the embedding endpoint."""
+        for idx_name in idx_names:
+            engine = self.get(idx_name)
+            if probe_query:
+                engine.retrieve(probe_query)
+
+    def swap(self, idx_name: str, engine=None):
+        """Replaces the engine for `idx_name` and returns the previous one (or None)."""
+        new_engine = engine if engine is not None else self._builder(idx_name)
+        with self._lock:
+            old_engine = self._engines.get(idx_name)
+            self._engines[idx_name] = new_engine
+        return old_engine
+
+    def close(self):
+        with self._lock:
+            self._engines.clear()
+        _close_clients()
+
+
+JINA_QUERY_CACHE_MODEL = ("local" if EMBEDDING_BACKEND == "local" else "jina") + "/jina-embeddings-v3/retrieval.query"
+
+
+def _jina_query_embedding(query: str):
+    model_name = JINA_QUERY_CACHE_MODEL
+    vector = embedding_cache.get(model_name, query)
+    if vector is None:
+        start = time.perf_counter()
+        if EMBEDDING_BACKEND == "local":
+            vector = local_jina_embeddings.embed_query(query)
+        else:
+            vector = _get_clients()[1].get_query_embedding(query)
+        embedding_cache.record_embed(time.perf_counter() - start)
+        embedding_cache.put(model_name, query, vector)
+    return vector
+
+
+async def _ajina_query_embedding(query: str):
+    model_name = JINA_QUERY_CACHE_MODEL
+    vector = await embedding_cache.aget(model_name, query)
+    if vector is None:
+        start = time.perf_counter()
+        if EMBEDDING_BACKEND == "local":
+            vector = await local_jina_embeddings.aembed_query(query)
+        else:
+            vector = await _get_clients()[1].aget_query_embedding(query)
+        embedding_cache.record_embed(time.perf_counter() - start)
+        await embedding_cache.aput(model_name, query, vector)
+    return vector
+
+
+retriever_registry = RetrieverRegistry()
+atexit.register(retriever_registry.close)
+
+if os.getenv("RAG_WARMUP_INDEXES"):
+    retriever_registry.warmup(os.getenv("RAG_WARMUP_INDEXES").split(","),
+                              probe_query=os.getenv("RAG_WARMUP_QUERY", ""))
+
+
 def rag_agent_tool(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
     """
     This function retrieves information from a vector database according to the query. 
     Information could be a policy docs, FAQs, process to follow to resolve an issue, etc.
     """
-    return [output.text for output in get_rag_engine().retrieve(query)]
+    if RAG_BACKEND == "pinecone":
+        query = QueryBundle(query_str=query, embedding=_jina_query_embedding(query))
+    # the local backend embeds with its own embed_fn
+    return [output.text for output in retriever_registry.get(RAG_INDEX_NAME).retrieve(query)]
 
 
+async def arag_agent_tool(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
+    """Async version of rag_agent_tool."""
+    engine = await asyncio.to_thread(retriever_registry.get, RAG_INDEX_NAME)
+    if RAG_BACKEND == "pinecone":
+        query = QueryBundle(query_str=query, embedding=await _ajina_query_embedding(query))
+    # PineconeVectorStore has no async query (its aquery runs the sync one on the event loop), so
+    # the retrieve goes to a worker thread, as HybridRetriever.aretrieve does
+    return [output.text for output in await asyncio.to_thread(engine.retrieve, query)]
+
+
+
+PAST_EXAMPLE_HEADER = "Below is past similar user query, its resolution and probable company policy derived from it. You need to refer it as hint to figure out if this will be applicable to current query and answer accordingly. Many a times you amy see that for some task support ticket was created and internal team completed the task. but since you might be having access to internal tools, you can now do it which was previously done by internal team. but before doing anything using tools do check policies.\n"
+HUMAN_INSTRUCTION_HEADER = "Below is the probable instruction doc for human agent to follow for resolving user query. You can use this as a guideline to understand what to do for resolving user query.\n"
+
+
+def _format_past_example(i, res):
+    return f"Past user query: {i+1}: " + get_snippet(res, render_past_example, i + 1)
+
+
+def _format_human_instruction(i, res):
+    return f"Human instruction doc: {i+1}: " + get_snippet(res, render_human_instruction, i + 1)
+
+
+def _max_distance(name, default):
+    """Per-tool relevance cutoff: <name>, else KB_MAX_DISTANCE, else `default`; "none" disables it."""
+    value = os.getenv(name) or os.getenv("KB_MAX_DISTANCE") or default
+    return None if value.lower() == "none" else float(value)
+
+
+# Scores are squared L2 distances between unit-norm mxbai-embed-large vectors, i.e. 2 - 2 * cosine,
+# so 1.0 keeps hits with cosine similarity >= 0.5. Re-check against benchmark_memory_tools.py recall
+# when the embedding model changes.
+PAST_EXAMPLE_MAX_DISTANCE = _max_distance("PAST_EXAMPLE_MAX_DISTANCE", "1.0")
+HUMAN_INSTRUCTION_MAX_DISTANCE = _max_distance("HUMAN_INSTRUCTION_MAX_DISTANCE", "1.0")
+
+# what the knowledge-base tools hand to the planner: hits past the tool's max distance are dropped,
+# near duplicate tickets collapsed, and the rest filled up to the token budget (top hit always kept).
+past_example_assembler = ContextAssembler(render_past_example,
+                                          token_budget=int(os.getenv("PAST_EXAMPLE_TOKEN_BUDGET", "1500")),
+                                          max_distance=PAST_EXAMPLE_MAX_DISTANCE,
+                                          duplicate_threshold=float(os.getenv("KB_DUPLICATE_THRESHOLD", "0.8")))
+human_instruction_assembler = ContextAssembler(render_human_instruction,
+                                               token_budget=int(os.getenv("HUMAN_INSTRUCTION_TOKEN_BUDGET", "1500")),
+                                               max_distance=HUMAN_INSTRUCTION_MAX_DISTANCE,
+                                               duplicate_threshold=float(os.getenv("KB_DUPLICATE_THRESHOLD", "0.8")))
+NO_RELEVANT_RESULTS = "No sufficiently relevant results found.\n"
+
+
+def _render(results, header, format_hit, assembler):
+    docs = assembler.select(results, header=header)
+    if not docs:
+        return header + NO_RELEVANT_RESULTS
+    return header + "".join(format_hit(i, doc) for i, doc in enumerate(docs))
+
+
+def _batch_search(store, queries, k, header, format_hit, assembler):
+    """Embeds all queries in one request, searches the index once and renders one block per query.
+    A document already rendered (or a near duplicate of one) for an earlier query is not repeated,
+    and all blocks together share the assembler's token budget."""
+    vectors = embeddings.embed_queries(queries)
+    all_results = store.similarity_search_with_score_by_vectors(vectors, k=k)
+    seen = []
+    blocks = []
+    budget = assembler.token_budget
+    for query, results in zip(queries, all_results):
+        block_header = f"## Query: {query}\n" + header
+        docs = assembler.select(results, header=block_header, seen=seen, budget=budget)
+        hits = [format_hit(i, doc) for i, doc in enumerate(docs)]
+        if not hits:
+            hits.append("No new results, see results for the queries above.\n")
+        block = block_header + "".join(hits)
+        budget -= count_tokens(block)
+        blocks.append(block)
+    return "\n".join(blocks)
+
 
 def past_successful_example(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
     """"
@@ -68,30 +321,84 @@ def past_successful_example(query: str, thought:str =Field(..., description="Ana
     if similar query has been resolved in past then its better to follow the same path.
     """
 
-    results = fd_store.similarity_search_with_score(query, k=5)
-    txt = "Below is past similar user query, its resolution and probable company policy derived from it. You need to refer it as hint to figure out if this will be applicable to current query and answer accordingly. Many a times you amy see that for some task support ticket was created and internal team completed the task. but since you might be having access to internal tools, you can now do it which was previously done by internal team. but before doing anything using tools do check policies.\n"
+    vector = embeddings.embed_query(query)
+    generation = fd_store.current_generation()
+    txt = past_example_cache.get(vector, generation=generation)
+    if txt is None:
+        results = fd_store.similarity_search_with_score_by_vector(vector, k=5)
+        txt = _render(results, PAST_EXAMPLE_HEADER, _format_past_example, past_example_assembler)
+        past_example_cache.put(vector, txt, generation=generation)
+    return txt
+
 
-    for i,(res, _) in enumerate(results):
-        res.metadata['answer'] = res.metadata['answer'] if res.metadata['answer']==res.metadata['answer'] else ""
-        res.metadata['derived_policies_or_process'] = res.metadata['derived_policies_or_process'] if res.metadata['derived_policies_or_process']==res.metadata['derived_policies_or_process'] else ""
-        txt+=f"Past user query: {i+1}: " + res.page_content +'\n' + f"Past answer by human support team {i+1}: "+res.metadata['answer'] + '\n' + f"Derived process or policy from this conversation {i+1}: " + res.metadata['derived_policies_or_process'] +'\n\n'
+async def apast_successful_example(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
+    """Async version of past_successful_example."""
+    vector = await embeddings.aembed_query(query)
+    generation = await asyncio.to_thread(fd_store.current_generation)
+    txt = past_example_cache.get(vector, generation=generation)
+    if txt is None:
+        results = await fd_store.asimilarity_search_with_score_by_vector(vector, k=5)
+        txt = _render(results, PAST_EXAMPLE_HEADER, _format_past_example, past_example_assembler)
+        past_example_cache.put(vector, txt, generation=generation)
     return txt
 
 
+def past_successful_examples_batch(queries: list[str], thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
+    """"
+    Same as past_successful_example but for several queries at once. Use it when the user message needs evidence for more than one sub-question.
+    Returns past similar user queries, their resolution and derived policies for every query. A past ticket is shown only once.
+    """
+    return _batch_search(fd_store, queries, 5, PAST_EXAMPLE_HEADER, _format_past_example, past_example_assembler)
+
+
 def what_human_would_do(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
     """"
     This helps in retriving information which is used by internal human support agent as a guideline/hint/process to be able to resolve user queries. An AI agent
     can use this information to understand/plan how to resolve user query. 
     """
 
-    results = knowledge_store.similarity_search_with_score(query, k=2)
-    txt = "Below is the probable instruction doc for human agent to follow for resolving user query. You can use this as a guideline to understand what to do for resolving user query.\n"
+    vector = embeddings.embed_query(query)
+    generation = knowledge_store.current_generation()
+    txt = human_instruction_cache.get(vector, generation=generation)
+    if txt is None:
+        results = knowledge_store.similarity_search_with_score_by_vector(vector, k=2)
+        txt = _render(results, HUMAN_INSTRUCTION_HEADER, _format_human_instruction, human_instruction_assembler)
+        human_instruction_cache.put(vector, txt, generation=generation)
+    return txt
+
 
-    for i,(res, _) in enumerate(results):
-        txt+=f"Human instruction doc: {i+1}: " + res.page_content +'\n'
+async def awhat_human_would_do(query: str, thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
+    """Async version of what_human_would_do."""
+    vector = await embeddings.aembed_query(query)
+    generation = await asyncio.to_thread(knowledge_store.current_generation)
+    txt = human_instruction_cache.get(vector, generation=generation)
+    if txt is None:
+        results = await knowledge_store.asimilarity_search_with_score_by_vector(vector, k=2)
+        txt = _render(results, HUMAN_INSTRUCTION_HEADER, _format_human_instruction, human_instruction_assembler)
+        human_instruction_cache.put(vector, txt, generation=generation)
     return txt
 
 
+def what_human_would_do_batch(queries: list[str], thought:str =Field(..., description="Analysis of all previous step and detailed reason for selecting current tool/step")):
+    """"
+    Same as what_human_would_do but for several queries at once. Use it when the user message needs guidelines for more than one sub-question.
+    An instruction doc is shown only once even if it matches several queries.
+    """
+    return _batch_search(knowledge_store, queries, 2, HUMAN_INSTRUCTION_HEADER, _format_human_instruction, human_instruction_assembler)
+
+
+def _as_tool(func, coroutine):
+    # the sync function stays the source of the tool schema and description; the coroutine is
+    # used by ToolNode when the graph runs under ainvoke/astream.
+    return StructuredTool.from_function(func=func, coroutine=coroutine, name=func.__name__,
+                                        description=func.__doc__.strip().strip('"').strip())
+
+
+rag_agent_async_tool = _as_tool(rag_agent_tool, arag_agent_tool)
+past_successful_example_async_tool = _as_tool(past_successful_example, apast_successful_example)
+what_human_would_do_async_tool = _as_tool(what_human_would_do, awhat_human_would_do)
+
+
 
 
 if __name__ == "__main__":
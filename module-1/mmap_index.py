@@ -0,0 +1,318 @@
+import asyncio
+import argparse
+import json
+import mmap
+import os
+import threading
+import time
+import weakref
+
+import numpy as np
+from langchain_core.documents import Document
+
+from snippets import RENDERERS, with_snippet
+
+# On-disk layout of a converted index directory:
+#   header.json   {"dim": D, "count": N}
+#   vectors.f32   N x D float32 matrix, row i is document i
+#   norms.f32     N float32 squared L2 norms of the rows
+#   docs.jsonl    one {"id", "page_content", "metadata"} record per row
+#   offsets.u64   N + 1 byte offsets of the records in docs.jsonl
+# Every file is opened with mmap, so worker processes on one host share the same pages. Files are
+# never rewritten once a header exists (readers may have them mapped); a rebuild goes to a new
+# directory published through a manifest (below), which `LazyIndex` picks up on its own.
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.f32"
+NORMS_FILE = "norms.f32"
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "offsets.u64"
+# A directory with a manifest instead of a header is a segmented index maintained by
+# resolution_ingest.py: {"version": n, "segments": [<segment dir>, ...], "tombstones": {<doc id>: p}}.
+# A row of a tombstoned id is only live in segments at position >= p.
+MANIFEST_FILE = "manifest.json"
+
+
+def write_mmap_index(out_dir: str, vectors, documents: list[Document], ids: list[str] = None, render=None):
+    """Writes `vectors` (N x D) and their documents in the memory-mapped layout.
+
+    `render` (see snippets.RENDERERS) pre-renders each document's tool output snippet and
+    token count into its metadata.
+    """
+    if os.path.exists(os.path.join(out_dir, HEADER_FILE)):
+        raise FileExistsError(f"{out_dir} already holds an index; build into a new directory")
+    if render is not None:
+        documents = [with_snippet(doc, render) for doc in documents]
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    os.makedirs(out_dir, exist_ok=True)
+    ids = ids or [getattr(doc, "id", None) or str(i) for i, doc in enumerate(documents)]
+    vectors.tofile(os.path.join(out_dir, VECTORS_FILE))
+    np.einsum("ij,ij->i", vectors, vectors).astype(np.float32).tofile(os.path.join(out_dir, NORMS_FILE))
+
+    offsets = [0]
+    with open(os.path.join(out_dir, DOCS_FILE), "wb") as f:
+        for doc_id, doc in zip(ids, documents):
+            line = json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                              default=str).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.asarray(offsets, dtype=np.uint64).tofile(os.path.join(out_dir, OFFSETS_FILE))
+
+    # header goes last so a half written directory is never picked up as valid
+    with open(os.path.join(out_dir, HEADER_FILE), "w") as f:
+        json.dump({"dim": int(vectors.shape[1]), "count": int(vectors.shape[0])}, f)
+
+
+def export_faiss_store(store, out_dir: str, render=None, id_fn=None):
+    """Converts a langchain FAISS store (flat index + docstore) to the memory-mapped layout.
+
+    Rows keep their docstore ids unless `id_fn(doc)` returns one (e.g. a ticket id from the metadata).
+    """
+    n = store.index.ntotal
+    vectors = store.index.reconstruct_n(0, n)
+    docstore_ids = [store.index_to_docstore_id[i] for i in range(n)]
+    documents = [store.docstore.search(doc_id) for doc_id in docstore_ids]
+    ids = docstore_ids
+    if id_fn is not None:
+        ids = [str(id_fn(doc) or doc_id) for doc, doc_id in zip(documents, docstore_ids)]
+    write_mmap_index(out_dir, vectors, documents, ids, render=render)
+
+
+def _close_docs(docs, docs_file):
+    if docs is not None:
+        docs.close()
+        docs_file.close()
+
+
+class MmapIndex:
+    """Exact (flat L2) vector index served from memory-mapped files.
+
+    Scores are squared L2 distances, the same as the IndexFlatL2 behind `FAISS.load_local`,
+    so lower is better and existing thresholds keep working.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+        self.dim = header["dim"]
+        self.count = header["count"]
+        if self.count == 0:
+            # empty files cannot be mmapped
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.norms = np.zeros(0, dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.uint64)
+            self._docs_file = self._docs = None
+        else:
+            self.vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dim))
+            self.norms = np.memmap(os.path.join(path, NORMS_FILE), dtype=np.float32, mode="r", shape=(self.count,))
+            self.offsets = np.memmap(os.path.join(path, OFFSETS_FILE), dtype=np.uint64, mode="r",
+                                     shape=(self.count + 1,))
+            self._docs_file = open(os.path.join(path, DOCS_FILE), "rb")
+            self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the documents file is closed once the last reference to the index is gone, so a search
+        # still running on an index that was swapped out (reload, new segmented version) finishes
+        self._finalizer = weakref.finalize(self, _close_docs, self._docs, self._docs_file)
+
+    def document(self, i: int) -> Document:
+        record = json.loads(self._docs[int(self.offsets[i]):int(self.offsets[i + 1])])
+        return Document(page_content=record["page_content"], metadata=record["metadata"], id=record["id"])
+
+    def search_by_vectors(self, queries, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Searches a (Q x D) query matrix in one pass, returns (distances, row indices), each Q x k."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, self.count)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        distances = self.norms[None, :] - 2.0 * (queries @ self.vectors.T) + np.einsum("ij,ij->i", queries, queries)[:, None]
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        return np.take_along_axis(top_distances, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def search_documents(self, queries, k: int) -> list[list[tuple[Document, float]]]:
+        distances, rows = self.search_by_vectors(queries, k)
+        return [[(self.document(i), float(d)) for d, i in zip(row_distances, row_ids)]
+                for row_distances, row_ids in zip(distances, rows)]
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        return self.search_documents(embedding, k)[0]
+
+    def close(self):
+        self._finalizer()
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+class SegmentedIndex:
+    """A base segment plus appended delta segments, minus tombstoned rows.
+
+    Every segment is an `MmapIndex`. A search drops rows hidden by a tombstone (retracted, or
+    superseded by a newer segment), re-fetching deeper from a segment when too many of its hits
+    were dropped, and merges the hits by distance. Segments that are still part of the
+    manifest are reused from `previous` instead of being re-opened; the ones it drops are closed
+    once `previous` is no longer searched (see `MmapIndex.close`).
+    """
+
+    def __init__(self, path: str, manifest: dict = None, previous: "SegmentedIndex" = None):
+        self.path = path
+        manifest = manifest or read_manifest(path)
+        self.version = manifest["version"]
+        self.tombstones = manifest.get("tombstones", {})
+        reuse = dict(previous.segments) if previous is not None else {}
+        self.segments = [(name, reuse.get(name) or MmapIndex(os.path.join(path, name)))
+                         for name in manifest["segments"]]
+        self.count = sum(segment.count for _, segment in self.segments)
+
+    def _live_hits(self, position: int, segment: MmapIndex, query, k: int) -> list[tuple[Document, float]]:
+        fetch = k
+        while True:
+            hits = segment.search_documents(query, fetch)[0]
+            live = [(doc, d) for doc, d in hits if position >= self.tombstones.get(doc.id, 0)]
+            if len(live) >= k or fetch >= segment.count:
+                return live[:k]
+            fetch *= 4
+
+    def search_documents(self, queries, k: int) -> list[list[tuple[Document, float]]]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        results = []
+        for query in queries:
+            hits = []
+            for position, (_, segment) in enumerate(self.segments):
+                hits.extend(self._live_hits(position, segment, query, k))
+            results.append(sorted(hits, key=lambda hit: hit[1])[:k])
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        return self.search_documents(embedding, k)[0]
+
+
+class LazyIndex:
+    """Index handle that loads on first use.
+
+    Prefers the memory-mapped copy at `mmap_path`; if it has not been converted yet it falls
+    back to `FAISS.load_local` on `faiss_path`, so behaviour is unchanged until the conversion
+    (`python mmap_index.py <faiss_dir> <mmap_dir> [--render ...]`) has been run. Every
+    `refresh_seconds` it checks `mmap_path` for a newly published manifest version (a rebuild,
+    or an ingestion by resolution_ingest.py) and switches to it, bumping `generation`.
+    """
+
+    def __init__(self, faiss_path: str, embeddings, mmap_path: str = None, refresh_seconds: float = 5.0):
+        self.faiss_path = faiss_path
+        self.mmap_path = mmap_path or faiss_path.rstrip("/") + ".mmap"
+        self.embeddings = embeddings
+        self.refresh_seconds = refresh_seconds
+        self._index = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        # bumped on every switch or reload; result caches compare it to drop entries from an older index
+        self.generation = 0
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load()
+        else:
+            self._maybe_refresh()
+        return self._index
+
+    def current_generation(self) -> int:
+        """`generation` of the index a search would use now, i.e. after checking for a newly
+        published version. Result caches call this rather than reading `generation`, so a hit
+        never outlives the version it was computed on."""
+        self._maybe_refresh()
+        return self.generation
+
+    def _maybe_refresh(self):
+        if self._index is not None and time.monotonic() - self._checked_at > self.refresh_seconds:
+            self._refresh()
+
+    def _refresh(self):
+        """Picks up a version published since the last check (also the first one, when the index
+        was loaded from the FAISS store or an unversioned directory)."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if not os.path.exists(os.path.join(self.mmap_path, MANIFEST_FILE)):
+                return
+            manifest = read_manifest(self.mmap_path)
+            previous = self._index if isinstance(self._index, SegmentedIndex) else None
+            if previous is None or manifest["version"] != previous.version:
+                self._index = SegmentedIndex(self.mmap_path, manifest, previous=previous)
+                self.generation += 1
+
+    def _load(self):
+        self._checked_at = time.monotonic()
+        if os.path.exists(os.path.join(self.mmap_path, MANIFEST_FILE)):
+            return SegmentedIndex(self.mmap_path)
+        if os.path.exists(os.path.join(self.mmap_path, HEADER_FILE)):
+            return MmapIndex(self.mmap_path)
+        from langchain_community.vectorstores import FAISS
+        return FAISS.load_local(self.faiss_path, self.embeddings, allow_dangerous_deserialization=True)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        return self.index.similarity_search_with_score_by_vector(embedding, k=k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k=k)
+
+    async def asimilarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """Async embedding, then the (CPU bound, GIL releasing) search and first load run off the event loop."""
+        embedding = await self.embeddings.aembed_query(query)
+        return await self.asimilarity_search_with_score_by_vector(embedding, k)
+
+    def similarity_search_with_score_by_vectors(self, embeddings, k: int = 4) -> list[list[tuple[Document, float]]]:
+        """Searches several query vectors against the matrix in a single call."""
+        index = self.index
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if isinstance(index, (MmapIndex, SegmentedIndex)):
+            return index.search_documents(queries, k)
+        distances, rows = index.index.search(queries, k)
+        results = []
+        for row_distances, row_ids in zip(distances, rows):
+            hits = []
+            for d, i in zip(row_distances, row_ids):
+                if i == -1:
+                    continue
+                doc_id = index.index_to_docstore_id[i]
+                doc = index.docstore.search(doc_id)
+                doc.id = doc_id
+                hits.append((doc, float(d)))
+            results.append(hits)
+        return results
+
+    def reload(self):
+        """Drops the loaded index so the next search loads it again (published versions are picked
+        up without this).
+
+        The old index is not closed here: searches already running on it keep their reference and
+        it closes itself when the last one returns.
+        """
+        with self._lock:
+            self._index = None
+            self.generation += 1
+
+
+if __name__ == "__main__":
+    from langchain_community.vectorstores import FAISS
+    from resolution_ingest import ResolutionIngestor
+    parser = argparse.ArgumentParser(description="Convert a langchain FAISS store to the memory-mapped layout.")
+    parser.add_argument("faiss_dir")
+    parser.add_argument("mmap_dir")
+    parser.add_argument("--render", choices=sorted(RENDERERS), help="pre-render tool output snippets")
+    args = parser.parse_args()
+    # embeddings are not needed to read vectors and documents out of the store
+    store = FAISS.load_local(args.faiss_dir, None, allow_dangerous_deserialization=True)
+    # written to a new segment directory and published as the next manifest version; running
+    # workers switch to it on their next refresh and the replaced build is deleted after a grace period
+    manifest = ResolutionIngestor(args.mmap_dir, render=RENDERERS.get(args.render)).rebuild(store)
+    print(f"published {store.index.ntotal} vectors as version {manifest['version']} of {args.mmap_dir}")
@@ -0,0 +1,153 @@
+"""Streaming bulk ingestion of the policy corpus into the Pinecone/Jina index behind `get_rag_engine`.
+
+Documents are chunked, embedded in large batches and upserted through `PineconeVectorStore.add`,
+which also computes the sparse vectors, so dense and sparse values match what the
+`add_sparse_vector=True` retriever queries with. Batches run with bounded concurrency and retry
+with exponential backoff; every finished batch is appended to a checkpoint file, so a rerun after
+a crash or rate-limit storm resumes where it stopped. Any llama_index vector store / embedding
+model can be passed in, e.g. `SimpleVectorStore` and `MockEmbedding` to test without network.
+
+    python pinecone_ingest.py docs.jsonl --index jina-ai-razorpay-payment-unique --checkpoint ingest.ckpt
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document, TextNode
+
+
+class BulkIngestPipeline:
+    """Chunk -> batch embed -> upsert, with bounded concurrency, retries and a resume checkpoint."""
+
+    def __init__(self, vector_store, embed_model, checkpoint_path: str = None, chunk_size: int = 512,
+                 chunk_overlap: int = 50, batch_size: int = 128, concurrency: int = 4, max_retries: int = 5,
+                 backoff_seconds: float = 1.0):
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.checkpoint_path = checkpoint_path
+        self.splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._lock = threading.Lock()
+        self.done = self._load_checkpoint()
+        self.stats = {"batches": 0, "skipped_batches": 0, "failed_batches": 0, "nodes": 0, "retries": 0}
+
+    def _load_checkpoint(self) -> set:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path) as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _mark_done(self, key: str):
+        with self._lock:
+            self.done.add(key)
+            if self.checkpoint_path:
+                with open(self.checkpoint_path, "a") as f:
+                    f.write(key + "\n")
+
+    def chunks(self, documents: Iterable[dict]) -> Iterator[TextNode]:
+        """Deterministic chunk ids (`<doc id>#<n>`), so reruns produce the same batches."""
+        for record in documents:
+            doc = Document(text=record["text"], metadata=record.get("metadata", {}), id_=str(record["id"]))
+            for i, node in enumerate(self.splitter.get_nodes_from_documents([doc])):
+                node.id_ = f"{doc.id_}#{i}"
+                yield node
+
+    def batches(self, documents: Iterable[dict]) -> Iterator[tuple[str, list[TextNode]]]:
+        batch = []
+        for node in self.chunks(documents):
+            batch.append(node)
+            if len(batch) == self.batch_size:
+                yield self._batch_key(batch), batch
+                batch = []
+        if batch:
+            yield self._batch_key(batch), batch
+
+    @staticmethod
+    def _batch_key(batch: list[TextNode]) -> str:
+        return hashlib.sha1("\n".join(node.id_ for node in batch).encode("utf-8")).hexdigest()
+
+    def _with_retry(self, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff_seconds * 2 ** attempt * (0.5 + random.random()))
+
+    def _process(self, key: str, batch: list[TextNode]):
+        texts = [node.get_content(metadata_mode="embed") for node in batch]
+        embeddings = self._with_retry(self.embed_model.get_text_embedding_batch, texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        self._with_retry(self.vector_store.add, batch)
+        self._mark_done(key)
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["nodes"] += len(batch)
+
+    def run(self, documents: Iterable[dict]) -> dict:
+        """Ingests a stream of {"id", "text", "metadata"} records; at most `concurrency` batches in flight."""
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for key, batch in self.batches(documents):
+                if key in self.done:
+                    self.stats["skipped_batches"] += 1
+                    continue
+                if len(in_flight) >= self.concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(finished)
+                in_flight.add(pool.submit(self._process, key, batch))
+            self._collect(wait(in_flight).done)
+        return dict(self.stats)
+
+    def _collect(self, futures):
+        for future in futures:
+            if future.exception() is not None:
+                # left out of the checkpoint, so the next run retries it
+                print("batch failed", future.exception())
+                self.stats["failed_batches"] += 1
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from llama_index.embeddings.jinaai import JinaEmbedding
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+    from pinecone import Pinecone
+
+    parser = argparse.ArgumentParser(description="Bulk ingest documents into the Pinecone hybrid index.")
+    parser.add_argument("documents", help="JSONL of {id, text, metadata}")
+    parser.add_argument("--index", default="jina-ai-razorpay-payment-unique")
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    args = parser.parse_args()
+
+    load_dotenv()
+    pinecone_index = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=args.concurrency).Index(args.index)
+    vector_store = PineconeVectorStore(pinecone_index=pinecone_index, add_sparse_vector=True, batch_size=args.batch_size)
+    embed_model = JinaEmbedding(api_key=os.getenv("JINA_API_KEY"), model="jina-embeddings-v3", task="retrieval.passage",
+                                embed_batch_size=args.batch_size, dimensions=1024)
+    pipeline = BulkIngestPipeline(vector_store, embed_model, checkpoint_path=args.checkpoint, chunk_size=args.chunk_size,
+                                  batch_size=args.batch_size, concurrency=args.concurrency)
+    print(pipeline.run(read_jsonl(args.documents)))
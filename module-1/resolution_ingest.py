@@ -0,0 +1,225 @@
+"""Incremental ingestion of resolved tickets into the FD_resolution index.
+
+The live index is a directory of memory-mapped segments (see mmap_index.SegmentedIndex) described
+by manifest.json. New ticket/answer pairs are embedded in batches and written as a new segment,
+retracted answers are tombstoned, and every change is published by atomically replacing the
+manifest, so running workers (LazyIndex) switch to the new version on their next refresh without
+a rebuild. Compaction merges the segments and drops tombstoned rows to keep search fast.
+
+    python resolution_ingest.py init <faiss_dir> <index_dir> [--id-key ticket_id]
+    python resolution_ingest.py add <index_dir> tickets.jsonl   # {"id", "query", "answer", "derived_policies_or_process"}
+    python resolution_ingest.py retract <index_dir> <ticket id> ...
+    python resolution_ingest.py compact <index_dir>
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+
+from mmap_index import MANIFEST_FILE, MmapIndex, export_faiss_store, read_manifest, write_mmap_index
+from snippets import render_past_example
+
+LOCK_FILE = ".ingest.lock"
+# metadata key of the ticket id in the bootstrapped FAISS corpus
+TICKET_ID_KEY = "ticket_id"
+
+
+class ResolutionIngestor:
+    """Single writer for a segmented index directory.
+
+    Writers on one host are serialised with a file lock; readers never take it.
+    """
+
+    def __init__(self, path: str, embeddings=None, render=render_past_example, batch_size: int = 64,
+                 max_segments: int = 8, gc_grace_seconds: float = 600):
+        self.path = path
+        self.embeddings = embeddings
+        self.render = render
+        self.batch_size = batch_size
+        self.max_segments = max_segments
+        self.gc_grace_seconds = gc_grace_seconds
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.path, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _manifest(self) -> dict:
+        if not os.path.exists(os.path.join(self.path, MANIFEST_FILE)):
+            return {"version": 0, "segments": [], "tombstones": {}}
+        return read_manifest(self.path)
+
+    def _publish(self, manifest: dict):
+        manifest = {**manifest, "version": manifest["version"] + 1, "published_at": time.time()}
+        tmp = os.path.join(self.path, f".{MANIFEST_FILE}.{uuid.uuid4().hex}")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, MANIFEST_FILE))
+        return manifest
+
+    def _new_segment_name(self) -> str:
+        return f"seg-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.batch_size]))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def bootstrap(self, faiss_store, id_key: str = TICKET_ID_KEY):
+        """Publishes an existing langchain FAISS store as the base segment.
+
+        Rows are keyed by the ticket id in metadata `id_key`, so `add` and `retract` can supersede
+        or retract base tickets; documents without one keep their docstore id.
+        """
+        with self._locked():
+            name = self._new_segment_name()
+            export_faiss_store(faiss_store, os.path.join(self.path, name), render=self.render,
+                               id_fn=lambda doc: doc.metadata.get(id_key))
+            manifest = self._manifest()
+            return self._publish({**manifest, "segments": manifest["segments"] + [name]})
+
+    def rebuild(self, faiss_store, id_key: str = TICKET_ID_KEY) -> dict:
+        """Replaces every segment with a fresh export of `faiss_store` (a full rebuild of the corpus).
+
+        Tombstones are cleared and the replaced segments retired, as in `compact`.
+        """
+        with self._locked():
+            name = self._new_segment_name()
+            export_faiss_store(faiss_store, os.path.join(self.path, name), render=self.render,
+                               id_fn=lambda doc: doc.metadata.get(id_key))
+            return self._replace_segments(self._manifest(), [name])
+
+    def add(self, tickets: list[dict]) -> dict:
+        """Appends resolved tickets ({"id", "query", "answer", "derived_policies_or_process"}).
+
+        Re-adding an id supersedes the earlier version of that ticket.
+        """
+        if not tickets:
+            return self._manifest()
+        documents = [Document(page_content=t["query"],
+                              metadata={"answer": t.get("answer", ""),
+                                        "derived_policies_or_process": t.get("derived_policies_or_process", "")})
+                     for t in tickets]
+        vectors = self._embed([doc.page_content for doc in documents])
+        ids = [str(t["id"]) for t in tickets]
+        with self._locked():
+            name = self._new_segment_name()
+            write_mmap_index(os.path.join(self.path, name), vectors, documents, ids, render=self.render)
+            manifest = self._manifest()
+            position = len(manifest["segments"])
+            # older rows of these ids (if any) are hidden, the new segment's rows stay live
+            tombstones = {**manifest["tombstones"], **{doc_id: position for doc_id in ids}}
+            manifest = self._publish({**manifest, "segments": manifest["segments"] + [name], "tombstones": tombstones})
+        if len(manifest["segments"]) > self.max_segments:
+            manifest = self.compact()
+        return manifest
+
+    def _known_ids(self, manifest: dict) -> set:
+        ids = set()
+        for name in manifest["segments"]:
+            segment = MmapIndex(os.path.join(self.path, name))
+            ids.update(segment.document(i).id for i in range(segment.count))
+            segment.close()
+        return ids
+
+    def retract(self, ids: list[str]) -> dict:
+        """Hides every row of `ids`. Raises KeyError (and publishes nothing) if an id is in no segment."""
+        with self._locked():
+            manifest = self._manifest()
+            unknown = set(map(str, ids)) - self._known_ids(manifest)
+            if unknown:
+                raise KeyError(f"not in the index: {', '.join(sorted(unknown))}")
+            position = len(manifest["segments"])
+            tombstones = {**manifest["tombstones"], **{str(doc_id): position for doc_id in ids}}
+            return self._publish({**manifest, "tombstones": tombstones})
+
+    def compact(self) -> dict:
+        """Merges every segment into one, dropping retracted and superseded rows. When no row is
+        left the manifest lists no segments (searches return nothing)."""
+        with self._locked():
+            manifest = self._manifest()
+            tombstones = manifest["tombstones"]
+            vectors, documents, ids = [], [], []
+            for position, name in enumerate(manifest["segments"]):
+                segment = MmapIndex(os.path.join(self.path, name))
+                for i in range(segment.count):
+                    doc = segment.document(i)
+                    if position >= tombstones.get(doc.id, 0):
+                        vectors.append(np.array(segment.vectors[i]))
+                        documents.append(doc)
+                        ids.append(doc.id)
+                segment.close()
+            segments = []
+            if vectors:
+                segments.append(self._new_segment_name())
+                # snippets are already in the metadata, no need to render again
+                write_mmap_index(os.path.join(self.path, segments[0]), np.stack(vectors), documents, ids)
+            return self._replace_segments(manifest, segments)
+
+    def _replace_segments(self, manifest: dict, segments: list[str]) -> dict:
+        retired = {**manifest.get("retired", {}), **{old: time.time() for old in manifest["segments"]}}
+        retired = self._gc(retired)
+        return self._publish({**manifest, "segments": segments, "tombstones": {}, "retired": retired})
+
+    def _gc(self, retired: dict) -> dict:
+        """Deletes segments retired more than `gc_grace_seconds` ago, so readers still on an older
+        manifest can finish opening them. Returns the segments that are kept for now."""
+        keep = {}
+        for name, retired_at in retired.items():
+            if time.time() - retired_at > self.gc_grace_seconds:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            else:
+                keep[name] = retired_at
+        return keep
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental ingestion into the FD_resolution index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init = sub.add_parser("init")
+    init.add_argument("faiss_dir")
+    init.add_argument("index_dir")
+    init.add_argument("--id-key", default=TICKET_ID_KEY, help="metadata key holding the ticket id")
+    add = sub.add_parser("add")
+    add.add_argument("index_dir")
+    add.add_argument("tickets", help="JSONL of {id, query, answer, derived_policies_or_process}")
+    retract = sub.add_parser("retract")
+    retract.add_argument("index_dir")
+    retract.add_argument("ids", nargs="+")
+    compact = sub.add_parser("compact")
+    compact.add_argument("index_dir")
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        from langchain_community.vectorstores import FAISS
+        store = FAISS.load_local(args.faiss_dir, None, allow_dangerous_deserialization=True)
+        print(ResolutionIngestor(args.index_dir).bootstrap(store, id_key=args.id_key))
+    elif args.command == "add":
+        from langchain_ollama import OllamaEmbeddings
+        with open(args.tickets) as f:
+            tickets = [json.loads(line) for line in f if line.strip()]
+        ingestor = ResolutionIngestor(args.index_dir, OllamaEmbeddings(model="mxbai-embed-large"))
+        print(ingestor.add(tickets))
+    elif args.command == "retract":
+        print(ResolutionIngestor(args.index_dir).retract(args.ids))
+    else:
+        print(ResolutionIngestor(args.index_dir).compact())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """Caches tool results by query embedding.
+
+    A lookup hits when the nearest cached query is within `max_distance` (cosine distance)
+    of the new one. Entries expire after `ttl_seconds`, the least recently used entry is
+    evicted once `max_items` is reached, and entries written for an older index
+    `generation` are never served, so rebuilding/reloading the index invalidates them.
+    """
+
+    def __init__(self, max_items: int = 5000, ttl_seconds: float = 3600, max_distance: float = 0.05):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._valid = np.zeros(max_items, dtype=bool)
+        self._entries = OrderedDict()  # slot -> (value, created_at, generation)
+        self._free = list(range(max_items - 1, -1, -1))
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, slot: int):
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free.append(slot)
+
+    def get(self, embedding, generation: int = 0):
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None or not self._valid.any():
+                self._stats["misses"] += 1
+                return None
+            similarities = self._vectors @ query
+            similarities[~self._valid] = -np.inf
+            slot = int(np.argmax(similarities))
+            if 1.0 - similarities[slot] > self.max_distance:
+                self._stats["misses"] += 1
+                return None
+            value, created_at, entry_generation = self._entries[slot]
+            if entry_generation != generation or time.monotonic() - created_at > self.ttl_seconds:
+                self._drop(slot)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(slot)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, embedding, value, generation: int = 0):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_items, vector.shape[0]), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evicted"] += 1
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = (value, time.monotonic(), generation)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._valid[:] = False
+            self._free = list(range(self.max_items - 1, -1, -1))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["items"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,70 @@
+from functools import lru_cache
+
+# Per-document text the knowledge-base tools print for a hit. It is rendered once when the
+# index is built (`python mmap_index.py <faiss_dir> <mmap_dir> --render past_example`) and
+# stored in the document metadata together with its token count, so a query only joins strings.
+# The hit number is not known at build time: snippets hold HIT_NUMBER where it goes and
+# `get_snippet` fills it in.
+SNIPPET_KEY = "numbered_snippet"
+SNIPPET_TOKENS_KEY = "numbered_snippet_tokens"
+HIT_NUMBER = "\x1f"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads the encoding on first use; offline builds fall back to an estimate
+        print("tiktoken encoding unavailable, estimating token counts", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _clean(value) -> str:
+    # the resolution corpus was built from a dataframe, missing fields come back as NaN
+    if value is None or value != value:
+        return ""
+    return str(value).replace(HIT_NUMBER, "")
+
+
+def render_past_example(doc) -> str:
+    return (_clean(doc.page_content) + '\n' +
+            f"Past answer by human support team {HIT_NUMBER}: " + _clean(doc.metadata.get('answer')) + '\n' +
+            f"Derived process or policy from this conversation {HIT_NUMBER}: " + _clean(doc.metadata.get('derived_policies_or_process')) + '\n\n')
+
+
+def render_human_instruction(doc) -> str:
+    return _clean(doc.page_content) + '\n'
+
+
+RENDERERS = {
+    "past_example": render_past_example,
+    "human_instruction": render_human_instruction,
+}
+
+
+def with_snippet(doc, render):
+    """Returns a copy of `doc` whose metadata carries the rendered snippet and its token count."""
+    text = render(doc)
+    metadata = {**doc.metadata, SNIPPET_KEY: text, SNIPPET_TOKENS_KEY: count_tokens(text.replace(HIT_NUMBER, "1"))}
+    return doc.model_copy(update={"metadata": metadata})
+
+
+def get_snippet(doc, render, number: int = None) -> str:
+    """The stored snippet, or one rendered now for indexes built before snippets existed, with
+    `number` (the hit's 1-based position) filled in."""
+    text = doc.metadata.get(SNIPPET_KEY) or render(doc)
+    return text.replace(HIT_NUMBER, "" if number is None else str(number))
+
+
+def get_snippet_tokens(doc, render) -> int:
+    tokens = doc.metadata.get(SNIPPET_TOKENS_KEY)
+    return tokens if tokens is not None else count_tokens(get_snippet(doc, render, 1))
@@ -1,3 +1,4 @@
+import hashlib
 from pydantic import BaseModel
 from typing import Any, Callable, Literal, Optional, Annotated
 from typing_extensions import TypedDict, Literal
@@ -10,11 +11,29 @@ from prompts import (
 
 
 
+class ChannelRetention(BaseModel):
+    """How much of an agent's com_channel is kept, in prompts and in the checkpoint."""
+    max_messages: Optional[int] = None
+    max_tokens: Optional[int] = None
+    # fold dropped messages into a rolling summary instead of forgetting them
+    summarize: bool = False
+    # with summarize, messages past the window are folded in once this many have built up (one LLM
+    # call per batch instead of one per step); until then they stay in the prompt
+    summarize_every: int = 8
+
+
 class Topic(BaseModel):
     name: str
     read_tools: list[Callable]
     update_tools: list[Callable]
     knowledge_base_tools: Optional[list[Callable]]
+    execution_mode: Literal["sync", "async"] = "sync"
+    memory_gate: Any = None
+    # co-worker channels / the planner's channel
+    retention: Optional[ChannelRetention] = None
+    planner_retention: Optional[ChannelRetention] = None
+    # tool_memo.ToolMemo; memoizes read tools per thread, invalidated by the update tools
+    tool_memo: Any = None
 
 class AgentConfig(BaseModel):
     agent_type: Literal["planner", "read", "update", "orchestrator", "memory", "custom"]
@@ -26,11 +45,18 @@ class AgentConfig(BaseModel):
     llm_model: Callable = None
     com_channel: str = "messages"
     msg_history: Literal["all", "last"] = "all"
+    # "async" builds executor nodes on ainvoke, for graphs served with ainvoke/astream
+    execution_mode: Literal["sync", "async"] = "sync"
+    retention: Optional[ChannelRetention] = None
     co_workers: Optional[list[BaseModel]] = None
     co_workers_abilitiy_str: Optional[list[str]] = None
     routes: Optional[list[BaseModel]] = None
     memory: Optional[BaseModel] = None
     orchestrator: Optional[BaseModel] = None
+    # memory_gate.MemoryGate; decides clear-cut memory agent turns without the LLM
+    memory_gate: Any = None
+    # topic_router.TopicRouter; routes confident turns without the orchestrator's LLM call
+    topic_router: Any = None
 
 
 def _build_agent_config(topic: Topic):
@@ -42,13 +68,17 @@ def _build_agent_config(topic: Topic):
         parent_name = f"{topic.name}_agent"
         agent_type = "read"
         tools = topic.read_tools
+        if topic.tool_memo is not None:
+            tools = [topic.tool_memo.memoize(t) for t in tools]
         com_channel = f"{name}_messages"
         read_agent_config = AgentConfig(name=name,
                                         agent_type=agent_type,
                                         parent_name=parent_name,
                                         tools=tools,
                                         com_channel=com_channel,
-                                        system_prompt=READ_AGENT_SYSTEM_INSTRUCTION
+                                        system_prompt=READ_AGENT_SYSTEM_INSTRUCTION,
+                                        execution_mode=topic.execution_mode,
+                                        retention=topic.retention
                                         )
         tmp = (f"# Co-worker {1} details:\n" +
                f"## Name: {name}\n" +
@@ -65,13 +95,17 @@ def _build_agent_config(topic: Topic):
         parent_name = f"{topic.name}_agent"
         agent_type = "update"
         tools = topic.update_tools
+        if topic.tool_memo is not None:
+            tools = [topic.tool_memo.invalidating(t) for t in tools]
         com_channel = f"{name}_messages"
         update_agent_config = AgentConfig(name=name,
                                         agent_type=agent_type,
                                         parent_name=parent_name,
                                         tools=tools,
                                         com_channel=com_channel,
-                                        system_prompt=UPDATE_AGENT_SYSTEM_INSTRUCTION
+                                        system_prompt=UPDATE_AGENT_SYSTEM_INSTRUCTION,
+                                        execution_mode=topic.execution_mode,
+                                        retention=topic.retention
                                         )
         tmp = (f"# Co-worker {2} details:\n" +
                f"## Name: {name}\n" +
@@ -94,7 +128,8 @@ def _build_agent_config(topic: Topic):
                                         agent_type=agent_type,
                                         tools=tools,
                                         com_channel=com_channel,
-                                        system_prompt=sys_instruction
+                                        system_prompt=sys_instruction,
+                                        memory_gate=topic.memory_gate
                                         )
     # build planner agent config
     name = f"{topic.name}_agent"
@@ -108,13 +143,14 @@ def _build_agent_config(topic: Topic):
                                     co_workers=planner_co_workers,
                                     co_workers_abilitiy_str=co_workers_abilitiy_str,
                                     memory=memory_agent_config,
-                                    system_prompt=sys_instruction
+                                    system_prompt=sys_instruction,
+                                    retention=topic.planner_retention
                                     )
     
     
     return planner_agent_config
 
-def build_agent_config(topics: Topic):
+def build_agent_config(topics: Topic, topic_router=None):
     all_agents = []
     for topic in topics:
         all_agents.append(_build_agent_config(topic))
@@ -122,7 +158,31 @@ def build_agent_config(topics: Topic):
     name = "orchestrator_agent"
     orchestrator_agent_config = AgentConfig(name=name,
                                             routes=all_agents,
-                                            agent_type="orchestrator")
+                                            agent_type="orchestrator",
+                                            topic_router=topic_router)
     for route in orchestrator_agent_config.routes:
         route.orchestrator = orchestrator_agent_config
     return orchestrator_agent_config
+
+
+def config_fingerprint(config) -> str:
+    """Hash of an agent config tree, for caching what is compiled from it.
+
+    Plain values are hashed by value; tools, models, checkpointers and other objects by identity
+    (they are kept alive by whatever is cached under the hash). The orchestrator back-reference
+    is reduced to its name.
+    """
+    def walk(value):
+        if isinstance(value, BaseModel):
+            return tuple((name, value.orchestrator.name if name == "orchestrator" and value.orchestrator else
+                          None if name == "orchestrator" else walk(getattr(value, name)))
+                         for name in type(value).model_fields)
+        if isinstance(value, (list, tuple)):
+            return tuple(walk(v) for v in value)
+        if isinstance(value, dict):
+            return tuple(sorted((k, walk(v)) for k, v in value.items()))
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return ("id", id(value))
+
+    return hashlib.sha1(repr(walk(config)).encode("utf-8")).hexdigest()
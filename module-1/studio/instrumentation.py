@@ -0,0 +1,284 @@
+"""Per-node latency and token instrumentation for the support agent graphs.
+
+`AgentInstrumentation` is a LangChain callback handler. Attach it to a graph run (or pass it to
+`CustomerSuportAgent(..., instrumentation=...)`) and it records, per node path such as
+`T_agent/T_read_agent/tools`:
+- node wall time, queue time (from the end of the graph's previous step to the node start),
+  retries and errors
+- LLM calls, latency, prompt and completion tokens, and prompt tokens served from the provider's
+  prompt cache (`prompt_cache_stats` gives the hit rate per agent)
+- tool calls, latency and errors
+
+Aggregates are served in Prometheus text format by `serve_metrics`, and every finished span is
+appended to a JSONL trace file, so no LangSmith account is needed.
+
+    instrumentation = AgentInstrumentation(trace_path="agent_trace.jsonl")
+    serve_metrics(instrumentation, port=9464)   # curl localhost:9464/metrics
+"""
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+METRIC_HELP = {
+    "agent_node_runs_total": "Node executions.",
+    "agent_node_seconds_total": "Node wall time.",
+    "agent_node_queue_seconds_total": "Time from the graph's previous step finishing to the node starting.",
+    "agent_node_retries_total": "Node retries.",
+    "agent_node_errors_total": "Node errors.",
+    "agent_llm_calls_total": "LLM calls.",
+    "agent_llm_seconds_total": "LLM call latency.",
+    "agent_llm_prompt_tokens_total": "LLM prompt tokens.",
+    "agent_llm_completion_tokens_total": "LLM completion tokens.",
+    "agent_llm_cached_prompt_tokens_total": "LLM prompt tokens read from the provider's prompt cache.",
+    "agent_tool_calls_total": "Tool calls.",
+    "agent_tool_seconds_total": "Tool latency.",
+    "agent_tool_errors_total": "Tool errors.",
+}
+
+
+def node_path(checkpoint_ns: str) -> str:
+    """`T_agent:<task id>|T_read_agent:<task id>` -> `T_agent/T_read_agent`."""
+    return "/".join(part.split(":")[0] for part in checkpoint_ns.split("|") if part)
+
+
+def _token_usage(response) -> tuple[int, int, int]:
+    """(prompt, completion, prompt tokens served from the provider's prompt cache)."""
+    prompt = completion = cached = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+                cached += (usage.get("input_token_details") or {}).get("cache_read", 0)
+    if not prompt and not completion:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return prompt, completion, cached
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class AgentInstrumentation(BaseCallbackHandler):
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._trace_lock = threading.Lock()
+        self._started = OrderedDict()  # recently started node task namespaces, to spot retries
+        # graph run id -> (step, time its last node finished); dropped when the graph run ends
+        self._graph_ready = {}
+        self._metrics = defaultdict(float)
+
+    # spans
+
+    def _start(self, run_id: UUID, kind: str, name: str, metadata: Optional[dict], **extra):
+        metadata = metadata or {}
+        self._spans[run_id] = {"kind": kind, "name": name, "path": node_path(metadata.get("langgraph_checkpoint_ns", "")),
+                               "thread_id": metadata.get("thread_id"), "start": time.time(), **extra}
+
+    def _finish(self, run_id: UUID, error: Optional[BaseException] = None, **fields) -> Optional[dict]:
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return None
+        end = time.time()
+        span.update(fields, wall_ms=(end - span["start"]) * 1000, end=end)
+        if error is not None:
+            span["error"] = repr(error)
+        return span
+
+    def _trace(self, span: Optional[dict]):
+        """Appends a finished span to the trace file; called outside `_lock` so file I/O does not
+        stall the other callbacks."""
+        if span is None or not self.trace_path:
+            return
+        line = json.dumps(span, default=str) + "\n"
+        with self._trace_lock:
+            with open(self.trace_path, "a") as f:
+                f.write(line)
+
+    def _inc(self, metric: str, value: float = 1.0, **labels):
+        self._metrics[(metric, tuple(sorted(labels.items())))] += value
+
+    # nodes
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any):
+        metadata = metadata or {}
+        name = kwargs.get("name")
+        # the node's own run, not the runnables inside it
+        if name is None or name != metadata.get("langgraph_node"):
+            return
+        checkpoint_ns = metadata.get("langgraph_checkpoint_ns", "")
+        # the node's parent run is the graph (or subgraph) run: unique per run, unlike the namespace
+        graph = parent_run_id
+        step = metadata.get("langgraph_step", 0)
+        with self._lock:
+            ready = self._graph_ready.get(graph)
+            queue_ms = (time.time() - ready[1]) * 1000 if ready and ready[0] == step - 1 else None
+            if name == "__start__":
+                self._start(run_id, "node", name, metadata, step=step, graph=graph)
+                return
+            retry = checkpoint_ns in self._started
+            self._started[checkpoint_ns] = True
+            if len(self._started) > 10000:
+                self._started.popitem(last=False)
+            self._start(run_id, "node", name, metadata, step=step, queue_ms=queue_ms, retry=retry, graph=graph)
+            path = self._spans[run_id]["path"]
+            if queue_ms is not None:
+                self._inc("agent_node_queue_seconds_total", queue_ms / 1000, node=path)
+            if retry:
+                self._inc("agent_node_retries_total", node=path)
+
+    def _end_node(self, run_id: UUID, error: Optional[BaseException] = None):
+        with self._lock:
+            # a graph run ending: its queue time bookkeeping is no longer needed
+            self._graph_ready.pop(run_id, None)
+            span = self._spans.get(run_id)
+            if span is None or span["kind"] != "node":
+                return
+            if span["name"] == "__start__":
+                # only marks when the graph's first step became ready
+                del self._spans[run_id]
+                self._graph_ready[span["graph"]] = (span["step"], time.time())
+                return
+            span = self._finish(run_id, error)
+            self._inc("agent_node_runs_total", node=span["path"])
+            self._inc("agent_node_seconds_total", span["wall_ms"] / 1000, node=span["path"])
+            if error is not None:
+                self._inc("agent_node_errors_total", node=span["path"])
+            ready = self._graph_ready.get(span["graph"])
+            if ready is None or ready[0] < span["step"] or (ready[0] == span["step"] and ready[1] < span["end"]):
+                self._graph_ready[span["graph"]] = (span["step"], span["end"])
+        self._trace(span)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._end_node(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        from langgraph.errors import GraphBubbleUp
+
+        # Command(graph=PARENT) and interrupts bubble up as exceptions, they are not failures
+        self._end_node(run_id, None if isinstance(error, GraphBubbleUp) else error)
+
+    def on_retry(self, retry_state, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            span = self._spans.get(run_id)
+            self._inc("agent_node_retries_total", node=span["path"] if span else "")
+
+    # LLM calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any):
+        with self._lock:
+            self._start(run_id, "llm", kwargs.get("name") or "llm", metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any):
+        with self._lock:
+            self._start(run_id, "llm", kwargs.get("name") or "llm", metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        prompt, completion, cached = _token_usage(response)
+        with self._lock:
+            span = self._finish(run_id, prompt_tokens=prompt, completion_tokens=completion, cached_prompt_tokens=cached)
+            if span is None:
+                return
+            self._inc("agent_llm_calls_total", node=span["path"])
+            self._inc("agent_llm_seconds_total", span["wall_ms"] / 1000, node=span["path"])
+            self._inc("agent_llm_prompt_tokens_total", prompt, node=span["path"])
+            self._inc("agent_llm_completion_tokens_total", completion, node=span["path"])
+            self._inc("agent_llm_cached_prompt_tokens_total", cached, node=span["path"])
+        self._trace(span)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            span = self._finish(run_id, error)
+            if span is not None:
+                self._inc("agent_llm_calls_total", node=span["path"])
+                self._inc("agent_llm_seconds_total", span["wall_ms"] / 1000, node=span["path"])
+        self._trace(span)
+
+    # tools
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any):
+        with self._lock:
+            self._start(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", "tool"), metadata)
+
+    def _end_tool(self, run_id: UUID, error: Optional[BaseException] = None):
+        with self._lock:
+            span = self._finish(run_id, error)
+            if span is None:
+                return
+            self._inc("agent_tool_calls_total", node=span["path"], tool=span["name"])
+            self._inc("agent_tool_seconds_total", span["wall_ms"] / 1000, node=span["path"], tool=span["name"])
+            if error is not None:
+                self._inc("agent_tool_errors_total", node=span["path"], tool=span["name"])
+        self._trace(span)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any):
+        self._end_tool(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end_tool(run_id, error)
+
+    # export
+
+    def prompt_cache_stats(self) -> dict:
+        """Per node path: prompt tokens, cached prompt tokens and the prompt-cache hit rate."""
+        with self._lock:
+            metrics = dict(self._metrics)
+        stats = {}
+        for (name, labels), value in metrics.items():
+            key = {"agent_llm_prompt_tokens_total": "prompt_tokens",
+                   "agent_llm_cached_prompt_tokens_total": "cached_prompt_tokens"}.get(name)
+            if key:
+                stats.setdefault(dict(labels)["node"], {"prompt_tokens": 0, "cached_prompt_tokens": 0})[key] = int(value)
+        for node in stats.values():
+            node["hit_rate"] = node["cached_prompt_tokens"] / node["prompt_tokens"] if node["prompt_tokens"] else 0.0
+        return stats
+
+    def prometheus(self) -> str:
+        with self._lock:
+            metrics = dict(self._metrics)
+        lines = []
+        for metric, help_text in METRIC_HELP.items():
+            samples = [(labels, value) for (name, labels), value in sorted(metrics.items()) if name == metric]
+            if not samples:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for labels, value in samples:
+                label_str = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f"{metric}{{{label_str}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(instrumentation: AgentInstrumentation, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves `instrumentation.prometheus()` at http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = instrumentation.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="agent-metrics", daemon=True).start()
+    return server
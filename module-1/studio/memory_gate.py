@@ -0,0 +1,56 @@
+import threading
+from typing import Callable, Literal, Optional
+
+import numpy as np
+
+
+class MemoryGate:
+    """Embedding pre-check run before the memory agent asks the LLM whether to retrieve.
+
+    The user message is compared by cosine similarity with the query that retrieved the current
+    `latest_memory` (not the memory text, whose fixed tool header would dominate the embedding):
+    at or above `reuse_threshold` the memory is kept ("reuse"), at or below `retrieve_threshold`
+    (or with no memory yet) new knowledge is retrieved ("retrieve"). Anything in between, or a
+    memory whose query is unknown, returns None and is left to the LLM. Pass a cached embedder
+    (e.g. memory_tools.embeddings) so the memory query is not re-embedded every turn.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], list[float]], reuse_threshold: float = 0.8,
+                 retrieve_threshold: float = 0.35):
+        self.embed_fn = embed_fn
+        self.reuse_threshold = reuse_threshold
+        self.retrieve_threshold = retrieve_threshold
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "reuse": 0, "retrieve": 0, "llm": 0}
+
+    def similarity(self, user_message: str, memory_query: str) -> float:
+        a = np.asarray(self.embed_fn(user_message), dtype=np.float32)
+        b = np.asarray(self.embed_fn(memory_query), dtype=np.float32)
+        norm = np.linalg.norm(a) * np.linalg.norm(b)
+        return float(a @ b / norm) if norm else 0.0
+
+    def decide(self, user_message: str, latest_memory: str,
+               memory_query: Optional[str] = None) -> Optional[Literal["reuse", "retrieve"]]:
+        if not latest_memory:
+            decision = "retrieve"
+        elif not memory_query:
+            decision = None
+        else:
+            score = self.similarity(user_message, memory_query)
+            if score >= self.reuse_threshold:
+                decision = "reuse"
+            elif score <= self.retrieve_threshold:
+                decision = "retrieve"
+            else:
+                decision = None
+        with self._lock:
+            self._stats["checks"] += 1
+            self._stats[decision or "llm"] += 1
+        return decision
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        skipped = stats["reuse"] + stats["retrieve"]
+        stats["skip_rate"] = skipped / stats["checks"] if stats["checks"] else 0.0
+        return stats
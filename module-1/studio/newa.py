@@ -1,14 +1,20 @@
 import sys
 sys.path.append('/Users/abhishek.kushwaha/projects/langchain-academy/module-1/studio')
 sys.path.append('/Users/abhishek.kushwaha/projects/langchain-academy/module-1')
-from rzp_agent import create_executor_agent, create_planner_agent, create_memory_agent, create_orchestrator_agent
+import os
+import threading
+from collections import OrderedDict
+import rzp_agent
+from rzp_agent import create_executor_agent, create_planner_agent, create_memory_agent, create_orchestrator_agent, tool_name, SubgraphCache
+from agent_config import config_fingerprint
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.memory import MemorySaver
 from pydantic import BaseModel, Field
 from functools import partial
 
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage
+from langchain_core.messages import AnyMessage, RemoveMessage
 from typing_extensions import TypedDict
 from typing import Any, Callable, Literal, Annotated, Optional
 from prompts import READ_AGENT_SYSTEM_INSTRUCTION, UPDATE_AGENT_SYSTEM_INSTRUCTION, PLANNER_AGENT_SYSTEM_INSTRUCTION
@@ -18,50 +24,212 @@ import sqlite3
 # In memory
 conn = sqlite3.connect(":memory:", check_same_thread = False)
 checkpointer = SqliteSaver(conn)
+# SqliteSaver has no async methods, graphs with async co-workers (run with ainvoke/astream) default to this
+async_checkpointer = MemorySaver()
+
+def default_checkpointer(config):
+    """The module's SqliteSaver, or the async capable saver when any co-worker runs async."""
+    is_async = any(cfg.execution_mode == "async" for route in config.routes for cfg in route.co_workers)
+    return async_checkpointer if is_async else checkpointer
+
+
+def last_value(left, right):
+    return right
+
 
 state_dict = {
     "messages": Annotated[list[AnyMessage], add_messages],
     "merchant_profile": str,
     "latest_memory": str,
-    "last_message_from": Literal["memory_agent", "read_agent", "tool", "other"],
+    # knowledge tool query that retrieved latest_memory (memory gate)
+    "latest_memory_query": str,
+    # topic agent the orchestrator routed the thread to last
+    "current_topic": str,
+    # speculative mode: memory group whose retrieval already ran this turn, and its result. The routed
+    # topic copies the result into latest_memory only when it belongs to the same group
+    "memory_speculation": Optional[str],
+    "speculated_memory": str,
+    "speculated_memory_query": str,
+    # co-workers delegated in parallel all report back in the same step
+    "last_message_from": Annotated[Literal["memory_agent", "read_agent", "tool", "other"], last_value],
 }
 
 
+def topic_node(load_topic, channels=(), is_async=False):
+    """Runs a topic graph as a parent node. `load_topic()` returns the compiled topic graph, so it
+    can be compiled on the first turn routed to it.
+
+    A subgraph node returns its final channel values, so messages its agents removed from `channels`
+    (retention) would stay in the parent state (and come back on the next turn); they are removed
+    here explicitly.
+    """
+    def reconcile(state, result):
+        update = dict(result)
+        for channel in channels:
+            kept = {m.id for m in result.get(channel, [])}
+            update[channel] = [RemoveMessage(id=m.id) for m in state.get(channel, []) if m.id not in kept] + result.get(channel, [])
+        return update
+
+    def run_topic(state):
+        return reconcile(state, load_topic().invoke(state))
+
+    async def arun_topic(state):
+        return reconcile(state, await load_topic().ainvoke(state))
+
+    return arun_topic if is_async else run_topic
+
+
+# compiled topic graphs shared by every CustomerSuportAgent in the process, keyed by config hash. An
+# LRU, so configs of tenants that stopped being served are released
+TOPIC_GRAPH_CACHE_SIZE = int(os.getenv("TOPIC_GRAPH_CACHE_SIZE", "256"))
+_topic_graphs = OrderedDict()
+_topic_graphs_lock = threading.Lock()
+# key -> lock held while that topic compiles, so different topics compile concurrently
+_topic_compile_locks = {}
+
+
+def _cached_topic_graph(key):
+    with _topic_graphs_lock:
+        entry = _topic_graphs.get(key)
+        if entry is not None:
+            _topic_graphs.move_to_end(key)
+            return entry[0]
+        return None
+
+
+def memory_signature(memory_config):
+    """Memory agents with the same tools and prompt retrieve the same knowledge for a message."""
+    return tuple(tool_name(t) for t in memory_config.tools), memory_config.system_prompt
+
+
+def speculative_memory_node(memory_configs, topic_groups, default_group, is_async=False, subgraphs=None):
+    """Runs one memory agent on the incoming message while the orchestrator is still routing.
+
+    The thread's current topic decides which memory agent speculates (the most shared one for a
+    new thread). Its result goes to `speculated_memory`, not `latest_memory`: the chosen topic graph
+    adopts it in place of running its own memory agent when `memory_speculation` names its group, and
+    otherwise ignores it, so another group's knowledge is never taken as current.
+    """
+    def pick(state):
+        group = topic_groups.get(state.get("current_topic"), default_group)
+        # compiled memory agents are shared, this is a cache lookup after the first turn
+        return group, create_memory_agent(None, memory_configs[group], subgraphs)
+
+    def result(group, out, state):
+        return {"speculated_memory": out.get("latest_memory", state.get("latest_memory", "")),
+                "speculated_memory_query": out.get("latest_memory_query", state.get("latest_memory_query", "")),
+                "memory_speculation": group}
+
+    def speculate(state):
+        group, memory_agent = pick(state)
+        return result(group, memory_agent.invoke(state), state)
+
+    async def aspeculate(state):
+        group, memory_agent = pick(state)
+        return result(group, await memory_agent.ainvoke(state), state)
+
+    return aspeculate if is_async else speculate
+
+
+def accept_speculative_memory(state):
+    """Topic graph node taking the speculative retrieval of its own memory group as latest_memory."""
+    return {"latest_memory": state["speculated_memory"],
+            "latest_memory_query": state.get("speculated_memory_query", ""),
+            "last_message_from": "memory_agent"}
+
+
 class CustomerSuportAgent:
-    def __init__(self, config):
+    def __init__(self, config, speculative_memory=False, instrumentation=None, lazy=True, checkpointer=None):
         self.csa_config = config
         self.topic_team = []
-    
-    def build(self, ):
-        # create state dict channels
-        for topic_agent_config in self.csa_config.routes:
-            for executor_agent_config in topic_agent_config.co_workers:
-                state_dict[executor_agent_config.com_channel] = Annotated[list[AnyMessage], add_messages]
-            state_dict[topic_agent_config.memory.com_channel] = Annotated[list[AnyMessage], add_messages]
-
-        
-        AgentState = TypedDict("AgentState", state_dict)
-        orchestrator_Agent = "topic_orchestrator"
-        # Co-wroker 1 details:
-        ## Name: {read_agent_name}
-        ## Description: {read_team}
+        # retrieve knowledge concurrently with orchestrator routing
+        self.speculative_memory = speculative_memory
+        # instrumentation.AgentInstrumentation, attached to every run of the built graph
+        self.instrumentation = instrumentation
+        # compile a topic's team on the first turn routed to it instead of in build()
+        self.lazy = lazy
+        self.checkpointer = checkpointer if checkpointer is not None else default_checkpointer(config)
+        # executor / memory agent graphs shared by this agent's topics
+        self.subgraphs = SubgraphCache()
+
+    def _state_schema(self):
+        # per instance: several agents (tenants) can be built in one process
+        channels = dict(state_dict)
         for topic_agent_config in self.csa_config.routes:
-            exeutor_agents = []
             for executor_agent_config in topic_agent_config.co_workers:
-                exeutor_agents.append(create_executor_agent(AgentState, executor_agent_config))
-            memory_agent = create_memory_agent(AgentState, topic_agent_config.memory)
-            planner_agent = create_planner_agent(AgentState, topic_agent_config)
-        
-            agent_builder = StateGraph(AgentState)
-            agent_builder.add_node(topic_agent_config.memory.name, memory_agent)
-            agent_builder.add_node(topic_agent_config.name, planner_agent)
-            for exeutor_agent, exeutor_agent_config in zip(exeutor_agents, topic_agent_config.co_workers):
-                agent_builder.add_node(exeutor_agent_config.name, exeutor_agent)
+                channels[executor_agent_config.com_channel] = Annotated[list[AnyMessage], add_messages]
+        return TypedDict("AgentState", channels)
+
+    def _compile_topic(self, AgentState, topic_agent_config, group):
+        exeutor_agents = []
+        for executor_agent_config in topic_agent_config.co_workers:
+            exeutor_agents.append(create_executor_agent(AgentState, executor_agent_config, self.subgraphs))
+        memory_agent = create_memory_agent(AgentState, topic_agent_config.memory, self.subgraphs)
+        planner_agent = create_planner_agent(AgentState, topic_agent_config)
 
+        agent_builder = StateGraph(AgentState)
+        agent_builder.add_node(topic_agent_config.memory.name, memory_agent)
+        agent_builder.add_node(topic_agent_config.name, planner_agent)
+        for exeutor_agent, exeutor_agent_config in zip(exeutor_agents, topic_agent_config.co_workers):
+            agent_builder.add_node(exeutor_agent_config.name, exeutor_agent)
+
+        if self.speculative_memory:
+            agent_builder.add_node("accept_speculative_memory", accept_speculative_memory)
+            agent_builder.add_conditional_edges(
+                START,
+                partial(lambda state, group, memory: "accept_speculative_memory" if state.get("memory_speculation") == group else memory,
+                        group=group, memory=topic_agent_config.memory.name),
+                [topic_agent_config.memory.name, "accept_speculative_memory"])
+            agent_builder.add_edge("accept_speculative_memory", topic_agent_config.name)
+        else:
             agent_builder.add_edge(START, topic_agent_config.memory.name)
-            agent_builder.add_edge(topic_agent_config.memory.name, topic_agent_config.name)
-            final_agent = agent_builder.compile(checkpointer=checkpointer)
-            self.topic_team.append(final_agent)
+        agent_builder.add_edge(topic_agent_config.memory.name, topic_agent_config.name)
+        return agent_builder.compile(checkpointer=self.checkpointer)
+
+    def _topic_loader(self, AgentState, topic_agent_config, group):
+        """Returns a function giving the compiled topic graph, from the process-wide cache when an
+        identical topic (same config, state channels, speculation group and checkpointer) exists."""
+        key = (config_fingerprint(topic_agent_config), tuple(sorted(AgentState.__annotations__)),
+               self.speculative_memory and group, id(self.checkpointer), id(rzp_agent.llm_model))
+
+        def load_topic():
+            graph = _cached_topic_graph(key)
+            if graph is not None:
+                return graph
+            with _topic_graphs_lock:
+                compile_lock = _topic_compile_locks.setdefault(key, threading.Lock())
+            with compile_lock:
+                graph = _cached_topic_graph(key)
+                if graph is not None:
+                    return graph
+                graph = self._compile_topic(AgentState, topic_agent_config, group)
+                with _topic_graphs_lock:
+                    # the config is kept with the graph, so the ids hashed into the key stay valid
+                    _topic_graphs[key] = (graph, topic_agent_config, self.checkpointer)
+                    while len(_topic_graphs) > TOPIC_GRAPH_CACHE_SIZE:
+                        _topic_graphs.popitem(last=False)
+                    _topic_compile_locks.pop(key, None)
+                return graph
+        return load_topic
+
+    def build(self, ):
+        AgentState = self._state_schema()
+        # topics whose memory agents are interchangeable share a speculation group, named after the first one
+        groups = {}
+        for topic_agent_config in self.csa_config.routes:
+            groups.setdefault(memory_signature(topic_agent_config.memory), topic_agent_config.memory.name)
+        topic_groups = {cfg.name: groups[memory_signature(cfg.memory)] for cfg in self.csa_config.routes}
+
+        self.topic_team = []
+        for topic_agent_config in self.csa_config.routes:
+            load_topic = self._topic_loader(AgentState, topic_agent_config, topic_groups[topic_agent_config.name])
+            retained_channels = [cfg.com_channel for cfg in [topic_agent_config] + topic_agent_config.co_workers
+                                 if cfg.retention is not None]
+            if self.lazy or retained_channels:
+                self.topic_team.append(topic_node(load_topic, retained_channels,
+                                                  any(cfg.execution_mode == "async" for cfg in topic_agent_config.co_workers)))
+            else:
+                self.topic_team.append(load_topic())
 
         orchestrator_agent = create_orchestrator_agent(AgentState, self.csa_config)
         agent_builder = StateGraph(AgentState)
@@ -70,10 +238,20 @@ class CustomerSuportAgent:
             agent_builder.add_node(each_agent_config.name, each_agent)
 
         agent_builder.add_edge(START, self.csa_config.name)
-        final_agent = agent_builder.compile(checkpointer=checkpointer)
+        if self.speculative_memory:
+            is_async = any(cfg.execution_mode == "async" for route in self.csa_config.routes for cfg in route.co_workers)
+            memory_configs = {}
+            for cfg in self.csa_config.routes:
+                memory_configs.setdefault(topic_groups[cfg.name], cfg.memory)
+            default_group = max(memory_configs, key=list(topic_groups.values()).count)
+            agent_builder.add_node("speculative_memory",
+                                   speculative_memory_node(memory_configs, topic_groups, default_group, is_async,
+                                                           self.subgraphs))
+            agent_builder.add_edge(START, "speculative_memory")
+        final_agent = agent_builder.compile(checkpointer=self.checkpointer)
+        if self.instrumentation is not None:
+            final_agent = final_agent.with_config({"callbacks": [self.instrumentation]})
         return final_agent
-        
-        #return self.topic_team[0]
     
 if __name__ == "__main__":
     from memory_tools import past_successful_example
@@ -1,4 +1,6 @@
-from langchain_core.messages import AnyMessage, AIMessage, ToolMessage, SystemMessage, RemoveMessage
+from langchain_core.messages import AnyMessage, AIMessage, HumanMessage, ToolMessage, SystemMessage, RemoveMessage, get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import BaseTool
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import create_react_agent, tools_condition, ToolNode
@@ -11,32 +13,139 @@ from trustcall import create_extractor
 
 from pydantic import BaseModel, Field
 from functools import partial
+import inspect
+import threading
+import uuid
 
 
 from langchain_openai import AzureChatOpenAI
+from prompts import CHANNEL_SUMMARY_INSTRUCTION, PLANNER_AGENT_TURN_CONTEXT, MEMORY_AGENT_TURN_CONTEXT
 
 
-def create_executor_agent(graph_state, config):
+def _split_channel(messages, retention, channel):
+    """Applies a ChannelRetention to a channel's messages. Returns (summary, kept, dropped).
 
-    prebuilt_agent = create_react_agent(
-        llm_model,
-        checkpointer=config.checkpointer,
-        tools=config.tools, 
-        state_modifier=config.system_prompt,
-    )
+    The newest message and the latest HumanMessage (the request being worked on) are always kept and
+    count towards the window; the rest of it is filled with the newest other messages."""
+    summary_id = f"{channel}_summary"
+    summary = next((m for m in messages if m.id == summary_id), None)
+    history = [m for m in messages if m.id != summary_id]
+    if not history:
+        return summary, [], []
+    human = next((i for i in range(len(history) - 1, -1, -1) if isinstance(history[i], HumanMessage)), None)
+    keep = {len(history) - 1} | ({human} if human is not None else set())
+    tokens = sum(count_tokens_approximately([history[i]]) for i in keep)
+    for i in range(len(history) - 1, -1, -1):
+        if i in keep:
+            continue
+        if retention.max_messages is not None and len(keep) >= retention.max_messages:
+            break
+        tokens += count_tokens_approximately([history[i]])
+        if retention.max_tokens is not None and tokens > retention.max_tokens:
+            break
+        keep.add(i)
+    return (summary, [m for i, m in enumerate(history) if i in keep],
+            [m for i, m in enumerate(history) if i not in keep])
 
-    def agent_node(state: graph_state
-                   ) -> Command[Literal[config.parent_name]]:
-        sender_channel = "messages"
+
+def _summary_request(summary, dropped):
+    return [SystemMessage(content=CHANNEL_SUMMARY_INSTRUCTION.format(summary=summary.content if summary else "NA",
+                                                                     messages=get_buffer_string(dropped)))]
+
+
+def _retained(channel, summary, kept, dropped, summary_text=None):
+    """Returns (messages to prompt with, channel update removing the dropped messages)."""
+    update = [RemoveMessage(id=m.id) for m in dropped]
+    if summary_text is not None:
+        # fixed id, so add_messages replaces the previous summary
+        summary = SystemMessage(content="Summary of earlier conversation: " + summary_text, id=f"{channel}_summary")
+        update.append(summary)
+    return ([summary] if summary else []) + kept, update
+
+
+def _trim_now(dropped, retention):
+    """With a rolling summary, messages past the window stay (in the channel and the prompt) until
+    `summarize_every` of them can be folded into the summary with one LLM call."""
+    return bool(dropped) and (not retention.summarize or len(dropped) >= retention.summarize_every)
+
+
+def apply_retention(messages, config):
+    """Bounds a channel by config.retention (last-N window, token budget, rolling summary)."""
+    if config.retention is None:
+        return messages, []
+    summary, kept, dropped = _split_channel(messages, config.retention, config.com_channel)
+    if not _trim_now(dropped, config.retention):
+        return ([summary] if summary else []) + [m for m in messages if m is not summary], []
+    summary_text = None
+    if config.retention.summarize:
+        summary_text = llm_model.invoke(_summary_request(summary, dropped)).content
+    return _retained(config.com_channel, summary, kept, dropped, summary_text)
+
+
+async def aapply_retention(messages, config):
+    if config.retention is None:
+        return messages, []
+    summary, kept, dropped = _split_channel(messages, config.retention, config.com_channel)
+    if not _trim_now(dropped, config.retention):
+        return ([summary] if summary else []) + [m for m in messages if m is not summary], []
+    summary_text = None
+    if config.retention.summarize:
+        summary_text = (await llm_model.ainvoke(_summary_request(summary, dropped))).content
+    return _retained(config.com_channel, summary, kept, dropped, summary_text)
+
+
+def tool_name(tool) -> str:
+    """Name the LLM calls a tool by: a plain function's name, or a BaseTool's (StructuredTool has no __name__)."""
+    return getattr(tool, "name", None) or tool.__name__
+
+
+class SubgraphCache:
+    """Compiled executor / memory agent graphs shared by the topics of one builder (e.g. a
+    CustomerSuportAgent), so it lives and dies with that builder.
+
+    Keys hold ids of the llm, tools and checkpointer. The cached graph keeps those objects alive,
+    so an id is never reused by another object while its entry exists.
+    """
+
+    def __init__(self):
+        self._graphs = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if key not in self._graphs:
+                self._graphs[key] = build()
+            return self._graphs[key]
+
+
+def _shared_graph(subgraphs, key, build):
+    return build() if subgraphs is None else subgraphs.get(key, build)
+
+
+def create_executor_agent(graph_state, config, subgraphs: SubgraphCache = None):
+
+    # the ReAct loop only depends on llm, tools and prompt; topics sharing them share the compiled graph
+    # (through `subgraphs`), the node below binds it to this co-worker's channel
+    prebuilt_agent = _shared_graph(
+        subgraphs,
+        ("executor", id(llm_model), tuple(id(t) for t in config.tools), config.system_prompt, id(config.checkpointer)),
+        lambda: create_react_agent(
+            llm_model,
+            checkpointer=config.checkpointer,
+            tools=config.tools,
+            state_modifier=config.system_prompt,
+        ))
+
+    def _agent_input(messages):
         if config.msg_history == "last":
-            messages = {"messages": state[config.com_channel][-1].content}
-        else:
-            messages = {"messages": state[config.com_channel]}
-        response = prebuilt_agent.invoke(messages, debug=False)
-        
+            return {"messages": messages[-1].content}
+        return {"messages": messages}
+
+    def _report_back(response, trim):
+        sender_channel = "messages"
         return Command(
             update={
-                config.com_channel: [
+                config.com_channel: trim + [
                     AIMessage(content=f"{config.name} coworker reply: " + response["messages"][-1].content, name=config.name)
                 ],
                 sender_channel: [
@@ -48,20 +157,41 @@ def create_executor_agent(graph_state, config):
             # We want our workers to ALWAYS "report back" to the supervisor when done
             goto=config.parent_name,
         )
-    return agent_node
+
+    def agent_node(state: graph_state
+                   ) -> Command[Literal[config.parent_name]]:
+        messages, trim = apply_retention(state[config.com_channel], config)
+        response = prebuilt_agent.invoke(_agent_input(messages), debug=False)
+        return _report_back(response, trim)
+
+    async def aagent_node(state: graph_state
+                          ) -> Command[Literal[config.parent_name]]:
+        # the ReAct loop runs on the event loop; cancelling the parent run cancels this await and
+        # with it the in-flight LLM / tool call, instead of leaving it running on a worker thread.
+        messages, trim = await aapply_retention(state[config.com_channel], config)
+        response = await prebuilt_agent.ainvoke(_agent_input(messages), debug=False)
+        return _report_back(response, trim)
+
+    return aagent_node if config.execution_mode == "async" else agent_node
 
 def create_planner_agent(
         graph_state,
         config
         ):
     
-    class DelegateToCoworker(BaseModel):
+    class CoworkerTask(BaseModel):
         co_worker_name: str = Field(
             description="co-worker name to delegate"
         )
         co_worker_task: str = Field(
             description="Description and details of the current task co-worker has to execute. do not include description of the agent ability."
         )
+
+    class DelegateToCoworker(BaseModel):
+        tasks: list[CoworkerTask] = Field(
+            description="Tasks to delegate in this step, at most one per co-worker. Tasks for different co-workers "
+            "must not depend on each other's result as they are executed in parallel."
+        )
         intermediate_response: str = Field(
             description=("We need to keep communicating with the user about. our conversation should not look mechanical."
                          "you can respond like 'ok let me check, please hold on for a moment' etc. Do not tell what exact process you are going to do. we nned not disclose internal working")
@@ -104,17 +234,27 @@ def create_planner_agent(
             user_profile = state.get(config.user_profile_key)"""
         
         co_workers = {cw.name:cw.com_channel for cw in config.co_workers}
+        history, trim = apply_retention(state[config.com_channel], config)
+        # static prompt, then the conversation (append-only), then this turn's context: the longest possible
+        # prefix stays identical between calls
         messages = [
-            {"role": "system", "content": config.system_prompt.format(latest_memory=state["latest_memory"], mechant_profile="NA")},
-        ] + state[config.com_channel]
+            {"role": "system", "content": config.system_prompt},
+        ] + history + [
+            {"role": "system", "content": PLANNER_AGENT_TURN_CONTEXT.format(latest_memory=state["latest_memory"], mechant_profile="NA")},
+        ]
 
         response = router_trust_call.invoke(messages)["responses"][0]
+        tasks = {}
         if isinstance(response.action, DelegateToCoworker):
             itm_resp = response.action.intermediate_response
-            if response.action.co_worker_name in co_workers.keys():
-                goto = [response.action.co_worker_name]
-            else:
-                raise ValueError(f"co-worker name is not in list {response}")
+            # one message per co-worker; a co-worker named twice gets its tasks in one message
+            for task in response.action.tasks:
+                if task.co_worker_name not in co_workers.keys():
+                    raise ValueError(f"co-worker name is not in list {response}")
+                tasks.setdefault(task.co_worker_name, []).append(task.co_worker_task)
+            if not tasks:
+                raise ValueError(f"no task to delegate {response}")
+            goto = list(tasks)
         elif isinstance(response.action, Response):
             goto = END
         elif isinstance(response.action, ReturnToOrchestrator):
@@ -126,7 +266,7 @@ def create_planner_agent(
         if goto == END:
             return Command(
             update={
-                config.com_channel: [
+                config.com_channel: trim + [
                     AIMessage(
                         content="Thought: " + response.thought+ "\nresponse_to_user: " + response.action.response, name="planner"
                     )
@@ -135,17 +275,19 @@ def create_planner_agent(
             },
             goto=END)
         else:
-            return Command(
-            update={co_workers[response.action.co_worker_name]:
-                [AIMessage(
-                    content="Thought: " + response.thought+ "\ncoworker_name: " + response.action.co_worker_name + "\ncoworker_task:" + response.action.co_worker_task, name="planner"
-                ) ],
+            # the delegated co-workers run concurrently in the next step and all report back to this
+            # planner, which then runs once with every reply in its channel
+            delegations = {name: "Thought: " + response.thought + "\ncoworker_name: " + name + "\ncoworker_task:" + "\n".join(task)
+                           for name, task in tasks.items()}
+            update = {**{co_workers[name]: [AIMessage(content=content, name="planner")]
+                       for name, content in delegations.items()},
                 "last_message_from":config.name,
-                "messages": [AIMessage(
-                    content="Thought: " + response.thought+ "\ncoworker_name: " + response.action.co_worker_name + "\ncoworker_task:" + response.action.co_worker_task, name="planner"
-                ) ,
-                AIMessage(content="response_to_user: " + itm_resp, name="planner")] if state["last_message_from"]=='memory_agent' else [],
-            },
+                "messages": [AIMessage(content=content, name="planner") for content in delegations.values()] +
+                [AIMessage(content="response_to_user: " + itm_resp, name="planner")] if state["last_message_from"]=='memory_agent' else [],
+            }
+            update[config.com_channel] = trim + update.get(config.com_channel, [])
+            return Command(
+            update=update,
             goto=goto
             )
         
@@ -174,49 +316,122 @@ def create_orchestrator_agent(graph_state, config):
             return Command(
                 goto=goto
             )
+        guess = None
+        if config.topic_router is not None:
+            goto, guess = config.topic_router.route(state[config.com_channel][-1].content, state.get("current_topic"))
+            if goto is not None:
+                return Command(update={"current_topic": goto}, goto=goto)
         messages = [
             {"role": "system", "content": config.system_prompt},
         ] + state[config.com_channel]
 
         response = router_trust_call.invoke(messages)["responses"][0]
         goto = response.action
+        if config.topic_router is not None:
+            config.topic_router.record_llm(guess, goto)
         return Command(
+            update={"current_topic": goto},
             goto=goto
             )
     return orchestrator_node
         
-def create_memory_agent(graph_state, config):
+def _last_value(left, right):
+    return right
+
+
+class MemoryAgentState(TypedDict):
+    messages: Annotated[list[AnyMessage], add_messages]
+    latest_memory: str
+    # the knowledge tool query that retrieved latest_memory, compared against by the memory gate
+    latest_memory_query: str
+    last_message_from: Annotated[str, _last_value]
+    # scratch channel for the tool call, never returned to the parent graph
+    memory_messages: Annotated[list[AnyMessage], add_messages]
+
+
+class MemoryAgentOutput(TypedDict):
+    latest_memory: str
+    latest_memory_query: str
+    last_message_from: Annotated[str, _last_value]
+
+
+def create_memory_agent(graph_state, config, subgraphs: SubgraphCache = None):
+    """The memory agent runs on its own state schema (reads messages / latest_memory, returns
+    latest_memory / last_message_from), so it does not depend on the topic's channels and one
+    compiled graph (from `subgraphs`) serves every topic with the same tools, prompt and gate."""
+    return _shared_graph(
+        subgraphs,
+        ("memory", id(llm_model), tuple(id(t) for t in config.tools), config.system_prompt, id(config.memory_gate),
+         id(config.checkpointer)),
+        lambda: _build_memory_agent(config))
+
+
+def _tool_arg_names(tool) -> set:
+    if isinstance(tool, BaseTool):
+        return set(tool.args)
+    return set(inspect.signature(tool).parameters)
+
+
+def _gate_tool_call(tools, user_message):
+    """The call the memory gate makes on "retrieve": the first knowledge base tool taking a single
+    `query` (else a batch one taking `queries`) on the user message, or None if no tool fits."""
+    for query_arg, value in (("query", user_message), ("queries", [user_message])):
+        for tool in tools:
+            arg_names = _tool_arg_names(tool)
+            if query_arg in arg_names:
+                args = {query_arg: value}
+                if "thought" in arg_names:
+                    args["thought"] = "latest memory does not cover the user message"
+                return {"name": tool_name(tool), "id": f"gate-{uuid.uuid4().hex}", "args": args}
+    return None
+
+
+def _build_memory_agent(config):
 
     llm_model_ = llm_model.bind_tools(config.tools)
+    com_channel = "memory_messages"
     
-    def should_load_memory(state: graph_state, flash_memory_key: str = "latest_memory"):
+    def should_load_memory(state: MemoryAgentState, flash_memory_key: str = "latest_memory"):
         
         if state.get(flash_memory_key, ""):
                 latest_memory = state[flash_memory_key]
         else:
                 latest_memory = "No knowledge retrived yet"
         user_message = state["messages"][-1].content
-        system_prompt = config.system_prompt.format(user_message=user_message, latest_memory=latest_memory)
-        response  = llm_model_.invoke([SystemMessage(content=system_prompt)])
-        return {config.com_channel:[response]}
+        if config.memory_gate is not None:
+            decision = config.memory_gate.decide(user_message, state.get(flash_memory_key, ""),
+                                                 state.get("latest_memory_query"))
+            if decision == "reuse":
+                return {com_channel: [AIMessage(content="no update required")]}
+            tool_call = _gate_tool_call(config.tools, user_message) if decision == "retrieve" else None
+            if tool_call is not None:
+                # same call the LLM would make, on the user message
+                return {com_channel: [AIMessage(content="", tool_calls=[tool_call])]}
+        turn_context = MEMORY_AGENT_TURN_CONTEXT.format(user_message=user_message, latest_memory=latest_memory)
+        response  = llm_model_.invoke([SystemMessage(content=config.system_prompt), HumanMessage(content=turn_context)])
+        return {com_channel:[response]}
     
-    def refresh_memory(state: graph_state, flash_memory_key: str = "latest_memory"):
-        last_mesage = state[config.com_channel][-1].copy()
-        delete_messages = [RemoveMessage(id=m.id) for m in state[config.com_channel]]
+    def refresh_memory(state: MemoryAgentState, flash_memory_key: str = "latest_memory"):
+        last_mesage = state[com_channel][-1].copy()
+        delete_messages = [RemoveMessage(id=m.id) for m in state[com_channel]]
         if isinstance(last_mesage, ToolMessage):
             print("tool message")
+            args = next(call["args"] for m in state[com_channel] if isinstance(m, AIMessage)
+                        for call in m.tool_calls if call["id"] == last_mesage.tool_call_id)
+            query = args.get("query") or "\n".join(args.get("queries") or [])
             return {flash_memory_key: last_mesage.content,
-                    config.com_channel: delete_messages,
+                    "latest_memory_query": query,
+                    com_channel: delete_messages,
                     "last_message_from": "memory_agent"}
             
         else:
             print("no tool message")
-            return {config.com_channel: delete_messages,
+            return {com_channel: delete_messages,
                     "last_message_from": "memory_agent"}
     
-    builder = StateGraph(graph_state)
+    builder = StateGraph(MemoryAgentState, output=MemoryAgentOutput)
     builder.add_node("should_load_memory", should_load_memory)
-    builder.add_node("tools", ToolNode(config.tools, messages_key=config.com_channel))
+    builder.add_node("tools", ToolNode(config.tools, messages_key=com_channel))
     builder.add_node("memory_refresh", refresh_memory)
 
     builder.add_edge(START, "should_load_memory")
@@ -224,12 +439,10 @@ def create_memory_agent(graph_state, config):
         "should_load_memory",
         # If the latest message (result) from assistant is a tool call -> tools_condition routes to tools
         # If the latest message (result) from assistant is a not a tool call -> tools_condition routes to END
-        partial(tools_condition, messages_key=config.com_channel),
+        partial(tools_condition, messages_key=com_channel),
         {"tools":"tools", END:"memory_refresh"}
         )
     builder.add_edge("tools", "memory_refresh")
     builder.add_edge("memory_refresh", END)
     memory_agent = builder.compile(checkpointer=config.checkpointer)
     return memory_agent
-
-        
\ No newline at end of file
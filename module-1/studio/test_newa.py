@@ -0,0 +1,322 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import StructuredTool
+
+import rzp_agent
+import newa
+from agent_config import Topic, build_agent_config
+
+
+class FakeLLM(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+rzp_agent.llm_model = FakeLLM(messages=iter([]))
+
+
+def get_merchant_config(merchant_id: str):
+    """Returns the merchant's configuration."""
+    return "config"
+
+
+def get_feature_status(merchant_id: str):
+    """Returns the merchant's feature flags."""
+    return "status"
+
+
+def past_successful_example(query: str, thought: str):
+    """Past tickets similar to the query."""
+    return "past example for " + query
+
+
+async def apast_successful_example(query: str, thought: str):
+    return "past example for " + query
+
+
+# same shape as memory_tools.past_successful_example_async_tool
+past_successful_example_async_tool = StructuredTool.from_function(
+    func=past_successful_example, coroutine=apast_successful_example, name="past_successful_example",
+    description="Past tickets similar to the query.")
+
+
+class AlwaysRetrieve:
+    def decide(self, user_message, latest_memory, memory_query=None):
+        return "retrieve"
+
+
+class RetrieveOnce:
+    def decide(self, user_message, latest_memory, memory_query=None):
+        return "reuse" if latest_memory else "retrieve"
+
+
+class RespondExtractor:
+    """Stands in for the planner's trustcall extractor: answers the user straight away."""
+
+    def __init__(self, tools):
+        self.Router = tools[0]
+        self.calls = 0
+
+    def respond(self):
+        Response = self.Router.model_fields["action"].annotation.__args__[1]
+        return self.Router(thought="done", action=Response(response="done"))
+
+    def invoke(self, messages):
+        self.calls += 1
+        return {"responses": [self.respond()]}
+
+
+def use_extractor(monkeypatch, extractor=RespondExtractor):
+    """Makes planners built from here on use `extractor(tools)`; returns the instances created."""
+    created = []
+
+    def create_extractor(llm, tools, tool_choice):
+        created.append(extractor(tools))
+        return created[-1]
+
+    monkeypatch.setattr(rzp_agent, "create_extractor", create_extractor)
+    return created
+
+
+def topic(name="Activations", **kwargs):
+    return Topic(**{"name": name, "read_tools": [get_merchant_config], "update_tools": [get_feature_status],
+                    "knowledge_base_tools": [past_successful_example], **kwargs})
+
+
+def turn(graph, message, thread_id, **state):
+    return graph.invoke({"messages": [HumanMessage(content=message)], "last_message_from": "other", "latest_memory": "",
+                         **state}, {"configurable": {"thread_id": thread_id}})
+
+
+def _async_topic_config(**kwargs):
+    return build_agent_config([Topic(name="Activations", read_tools=[get_merchant_config],
+                                     update_tools=[get_feature_status],
+                                     knowledge_base_tools=[past_successful_example_async_tool],
+                                     execution_mode="async", **kwargs)])
+
+
+def test_build_with_async_tool_topic():
+    for speculative_memory in (False, True):
+        graph = newa.CustomerSuportAgent(_async_topic_config(), speculative_memory=speculative_memory).build()
+        assert "Activations_agent" in graph.get_graph().nodes
+
+
+def test_memory_gate_retrieve_calls_async_tool():
+    config = _async_topic_config(memory_gate=AlwaysRetrieve())
+    memory_agent = rzp_agent.create_memory_agent(None, config.routes[0].memory)
+    out = memory_agent.invoke({"messages": [HumanMessage(content="enable international payments")], "latest_memory": ""})
+    assert out["latest_memory"] == "past example for enable international payments"
+
+
+def test_async_topic_defaults_to_async_checkpointer():
+    graph = newa.CustomerSuportAgent(_async_topic_config()).build()
+    # SqliteSaver raises NotImplementedError here
+    state = asyncio.run(graph.aget_state({"configurable": {"thread_id": "async-default"}}))
+    assert state.values == {}
+
+
+def test_memory_gate_compares_against_memory_query():
+    from memory_gate import MemoryGate
+
+    vectors = {"enable international payments": [1.0, 0.0], "international payments are not enabled": [0.9, 0.1],
+               "change my contact name": [0.0, 1.0]}
+    config = _async_topic_config(memory_gate=MemoryGate(vectors.get, reuse_threshold=0.8, retrieve_threshold=0.3))
+    memory_agent = rzp_agent.create_memory_agent(None, config.routes[0].memory)
+    out = memory_agent.invoke({"messages": [HumanMessage(content="enable international payments")], "latest_memory": ""})
+    assert out["latest_memory_query"] == "enable international payments"
+
+    state = {"latest_memory": out["latest_memory"], "latest_memory_query": out["latest_memory_query"]}
+    reused = memory_agent.invoke({**state, "messages": [HumanMessage(content="international payments are not enabled")]})
+    assert reused["latest_memory_query"] == "enable international payments"
+    retrieved = memory_agent.invoke({**state, "messages": [HumanMessage(content="change my contact name")]})
+    assert retrieved["latest_memory_query"] == "change my contact name"
+
+
+def test_retention_keeps_current_request_and_summarizes_in_batches(monkeypatch):
+    from agent_config import AgentConfig, ChannelRetention
+
+    summaries = []
+
+    class SummaryLLM(FakeLLM):
+        def invoke(self, messages, *args, **kwargs):
+            summaries.append(messages)
+            return AIMessage(content=f"summary {len(summaries)}")
+
+    monkeypatch.setattr(rzp_agent, "llm_model", SummaryLLM(messages=iter([])))
+    config = AgentConfig(agent_type="planner", retention=ChannelRetention(max_messages=4, summarize=True,
+                                                                           summarize_every=3))
+    channel = [HumanMessage(content="old request", id="h1"), AIMessage(content="old reply", id="a1"),
+               HumanMessage(content="enable international payments", id="h2")]
+    channel += [AIMessage(content=f"coworker reply {i}", id=f"r{i}") for i in range(4)]
+    prompt, update = rzp_agent.apply_retention(channel, config)
+    # 3 messages past the window: folded into the summary in one call
+    assert len(summaries) == 1
+    assert [m.id for m in prompt] == ["messages_summary", "h2", "r1", "r2", "r3"]
+    assert {m.id for m in update if m.type == "remove"} == {"h1", "a1", "r0"}
+
+    channel = [prompt[0], *prompt[1:], AIMessage(content="coworker reply 4", id="r4")]
+    prompt, update = rzp_agent.apply_retention(channel, config)
+    # one message past the window: kept until the batch fills up
+    assert len(summaries) == 1 and update == []
+    assert "h2" in [m.id for m in prompt]
+
+
+def test_tool_memo_update_invalidates_other_threads(monkeypatch):
+    import tool_memo
+    from tool_memo import ToolMemo
+
+    merchant_config = {"m1": "v1"}
+
+    def read_config(merchant_id: str, thought: str = ""):
+        return merchant_config[merchant_id]
+
+    def update_config(merchant_id: str, value: str, thought: str = ""):
+        merchant_config[merchant_id] = value
+
+    memo = ToolMemo()
+    read, update = memo.memoize(read_config), memo.invalidating(update_config)
+    current_thread = "t2"
+    monkeypatch.setattr(tool_memo, "_thread_id", lambda: current_thread)
+    assert read("m1") == "v1"
+    current_thread = "t1"
+    update("m1", "v2")
+    current_thread = "t2"
+    assert read("m1") == "v2"
+
+
+def test_speculation_for_another_memory_group_is_not_used(monkeypatch):
+    calls = []
+
+    def payments_kb(query: str, thought: str):
+        """Payments knowledge."""
+        calls.append("payments")
+        return "payments: " + query
+
+    def accounts_kb(query: str, thought: str):
+        """Accounts knowledge."""
+        calls.append("accounts")
+        return "accounts: " + query
+
+    class ToAccounts:
+        def route(self, message, previous_topic):
+            return "Accounts_agent", None
+
+    use_extractor(monkeypatch)
+    config = build_agent_config([topic(name, knowledge_base_tools=[kb], memory_gate=RetrieveOnce())
+                                 for name, kb in (("Activations", payments_kb), ("Accounts", accounts_kb))],
+                                topic_router=ToAccounts())
+    graph = newa.CustomerSuportAgent(config, speculative_memory=True).build()
+    for current_topic, expected_calls in (("Activations_agent", ["payments", "accounts"]), ("Accounts_agent", ["accounts"])):
+        calls.clear()
+        out = turn(graph, "change my contact name", "speculation-" + current_topic, current_topic=current_topic)
+        assert sorted(calls) == sorted(expected_calls)
+        assert out["latest_memory"] == "accounts: change my contact name"
+
+
+def test_instrumentation_forgets_finished_graph_runs(monkeypatch):
+    from instrumentation import AgentInstrumentation
+
+    use_extractor(monkeypatch)
+    inst = AgentInstrumentation()
+    graph = newa.CustomerSuportAgent(build_agent_config([topic(memory_gate=RetrieveOnce())]), instrumentation=inst).build()
+    for _ in range(3):
+        turn(graph, "enable international payments", "instrumentation", current_topic="Activations_agent")
+        assert inst._graph_ready == {} and inst._spans == {}
+
+
+def test_subgraphs_are_shared_by_topics_and_released_with_the_agent():
+    import gc
+    import weakref
+
+    config = build_agent_config([topic(name) for name in ("Activations", "Accounts")])
+    agent = newa.CustomerSuportAgent(config, lazy=False)
+    agent.build()
+    # read, update and memory agent graphs, one each for both topics
+    assert len(agent.subgraphs._graphs) == 3
+
+    subgraphs = weakref.ref(agent.subgraphs)
+    del agent
+    gc.collect()
+    assert subgraphs() is None
+
+
+def test_topic_graph_cache_is_bounded_and_compiles_per_key(monkeypatch):
+    import threading
+
+    monkeypatch.setattr(newa, "TOPIC_GRAPH_CACHE_SIZE", 2)
+    monkeypatch.setattr(newa, "_topic_graphs", newa.OrderedDict())
+    tenants = [build_agent_config([topic(f"Tenant{i}")]) for i in range(3)]
+    for config in tenants:
+        newa.CustomerSuportAgent(config, lazy=False).build()
+    assert len(newa._topic_graphs) == 2
+    assert "Tenant0_agent" not in {entry[1].name for entry in newa._topic_graphs.values()}
+
+    # a slow first compile of one tenant's topic does not hold up another tenant's
+    started, release = threading.Event(), threading.Event()
+    compile_topic = newa.CustomerSuportAgent._compile_topic
+
+    def slow_compile(self, AgentState, topic_agent_config, group):
+        if topic_agent_config.name == "Tenant0_agent":
+            started.set()
+            release.wait(5)
+        return compile_topic(self, AgentState, topic_agent_config, group)
+
+    monkeypatch.setattr(newa.CustomerSuportAgent, "_compile_topic", slow_compile)
+    slow = threading.Thread(target=lambda: newa.CustomerSuportAgent(tenants[0], lazy=False).build())
+    slow.start()
+    assert started.wait(5)
+    fresh = build_agent_config([topic("Tenant3")])
+    other = threading.Thread(target=lambda: newa.CustomerSuportAgent(fresh, lazy=False).build())
+    other.start()
+    other.join(2)
+    finished_first = not other.is_alive()
+    release.set()
+    slow.join()
+    other.join()
+    assert finished_first
+
+
+def test_memory_gate_retrieve_calls_a_tool_taking_query():
+    def past_examples_batch(queries: list[str], thought: str):
+        """Past tickets for several queries."""
+        return "batch: " + " | ".join(queries)
+
+    for tools, expected in (([past_examples_batch, past_successful_example], "past example for refund status"),
+                            ([past_examples_batch], "batch: refund status")):
+        config = build_agent_config([topic(update_tools=[], knowledge_base_tools=tools, memory_gate=AlwaysRetrieve())])
+        memory_agent = rzp_agent.create_memory_agent(None, config.routes[0].memory)
+        out = memory_agent.invoke({"messages": [HumanMessage(content="refund status")], "latest_memory": ""})
+        assert out["latest_memory"] == expected
+        assert out["latest_memory_query"] == "refund status"
+
+
+def test_planner_delegates_to_several_coworkers_in_one_step(monkeypatch):
+    class DelegateToAll(RespondExtractor):
+        """Delegates to every co-worker on the first call, then responds."""
+
+        def invoke(self, messages):
+            self.calls += 1
+            if self.calls > 1:
+                return {"responses": [self.respond()]}
+            Delegate = self.Router.model_fields["action"].annotation.__args__[0]
+            Task = Delegate.model_fields["tasks"].annotation.__args__[0]
+            tasks = [Task(co_worker_name=name, co_worker_task="check " + name)
+                     for name in ("Activations_read_agent", "Activations_update_agent")]
+            return {"responses": [self.Router(thought="both", action=Delegate(tasks=tasks, intermediate_response="one moment"))]}
+
+    monkeypatch.setattr(rzp_agent, "llm_model", FakeLLM(messages=iter([AIMessage(content="read done"),
+                                                                        AIMessage(content="update done")])))
+    planners = use_extractor(monkeypatch, DelegateToAll)
+    graph = newa.CustomerSuportAgent(build_agent_config([topic(memory_gate=RetrieveOnce())])).build()
+    out = turn(graph, "enable international payments", "delegation", current_topic="Activations_agent")
+    # both co-workers ran in the same step and the planner ran once more with both replies
+    assert planners[0].calls == 2
+    for channel in ("Activations_read_agent_messages", "Activations_update_agent_messages"):
+        assert "coworker reply" in out[channel][-1].content
+    assert out["messages"][-1].content.endswith("response_to_user: done")
@@ -0,0 +1,26 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from topic_router import TopicRouter
+
+VECTORS = {"enable international payments": [1.0, 0.0, 0.0], "international card payments": [0.9, 0.1, 0.0],
+           "change my contact name": [0.0, 1.0, 0.0], "update email address": [0.1, 0.9, 0.0],
+           "payments for my account": [0.55, 0.52, 0.0], "hello": [0.0, 0.0, 1.0]}
+
+
+def test_unfitted_router_falls_through_to_llm():
+    router = TopicRouter(VECTORS.get)
+    assert router.classify("enable international payments", "Activations_agent") == (None, "llm", None)
+    assert router.route("enable international payments") == (None, None)
+    assert router.stats()["llm"] == 1
+
+
+def test_sticky_classifier_and_llm_tiers():
+    router = TopicRouter(VECTORS.get).fit(["enable international payments", "change my contact name"],
+                                          ["Activations_agent", "Accounts_agent"])
+    assert router.classify("international card payments")[:2] == ("Activations_agent", "classifier")
+    assert router.classify("payments for my account", "Accounts_agent")[:2] == ("Accounts_agent", "sticky")
+    assert router.classify("payments for my account")[:2] == (None, "llm")
+    assert router.classify("hello")[:2] == (None, "llm")
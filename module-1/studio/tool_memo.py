@@ -0,0 +1,137 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from langgraph.config import get_config
+
+
+def _thread_id() -> Optional[str]:
+    try:
+        return get_config()["configurable"].get("thread_id")
+    except RuntimeError:
+        # called outside a graph run
+        return None
+
+
+class ToolMemo:
+    """Thread-scoped memoization of read tools, invalidated by update tools.
+
+    Results are keyed by (thread_id, tool, arguments) and expire after `ttl_seconds`. Arguments in
+    `ignore_args` (the free-text `thought`) are not part of the key. A wrapped update tool, once it
+    returns, drops the entries for the same `scope_arg` value (the merchant) in every thread, since
+    other conversations may have read the same merchant. Entries without a scope, and all entries
+    when the update tool has no such argument, are dropped too.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_items: int = 10000, scope_arg: str = "merchant_id",
+                 ignore_args: tuple = ("thought",)):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.scope_arg = scope_arg
+        self.ignore_args = ignore_args
+        self._entries = OrderedDict()  # key -> (expires_at, scope, result)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        # one wrapper per tool, so topics sharing a tool keep sharing the compiled executor graph
+        self._wrappers = {}
+
+    def _arguments(self, func: Callable, args, kwargs) -> dict:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        return {k: v for k, v in bound.arguments.items() if k not in self.ignore_args}
+
+    def _key(self, func: Callable, arguments: dict) -> tuple:
+        return _thread_id(), func.__name__, json.dumps(arguments, sort_keys=True, default=str)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def _put(self, key, scope, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, scope, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, scope=None):
+        """Drops memoized reads of `scope` (or everything when None) across all threads."""
+        with self._lock:
+            stale = [key for key, (_, entry_scope, _) in self._entries.items()
+                     if scope is None or entry_scope is None or entry_scope == scope]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidated"] += len(stale)
+
+    def memoize(self, func: Callable) -> Callable:
+        """Wraps a read tool; name, docstring and signature are kept for the tool schema."""
+        if ("memoize", func) not in self._wrappers:
+            self._wrappers[("memoize", func)] = self._memoize(func)
+        return self._wrappers[("memoize", func)]
+
+    def _memoize(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def awrapper(*args, **kwargs):
+                arguments = self._arguments(func, args, kwargs)
+                key = self._key(func, arguments)
+                entry = self._get(key)
+                if entry is not None:
+                    return entry[2]
+                result = await func(*args, **kwargs)
+                self._put(key, arguments.get(self.scope_arg), result)
+                return result
+            return awrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = self._arguments(func, args, kwargs)
+            key = self._key(func, arguments)
+            entry = self._get(key)
+            if entry is not None:
+                return entry[2]
+            result = func(*args, **kwargs)
+            self._put(key, arguments.get(self.scope_arg), result)
+            return result
+        return wrapper
+
+    def invalidating(self, func: Callable) -> Callable:
+        """Wraps an update tool so memoized reads of what it changed are dropped."""
+        if ("invalidating", func) not in self._wrappers:
+            self._wrappers[("invalidating", func)] = self._invalidating(func)
+        return self._wrappers[("invalidating", func)]
+
+    def _invalidating(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def awrapper(*args, **kwargs):
+                result = await func(*args, **kwargs)
+                self.invalidate(self._arguments(func, args, kwargs).get(self.scope_arg))
+                return result
+            return awrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            self.invalidate(self._arguments(func, args, kwargs).get(self.scope_arg))
+            return result
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,135 @@
+"""Tiered topic routing for the orchestrator agent.
+
+Each turn is routed by the cheapest tier that is confident enough:
+1. sticky     - keep the thread's current topic while the message still scores close to the best topic
+2. classifier - nearest topic centroid over embeddings of labelled history, when it wins by a clear margin
+3. llm        - everything else goes to the orchestrator's LLM router
+
+Labelled history is JSONL of {"message": ..., "topic": <topic agent name>}, e.g. exported from past
+orchestrator decisions. Offline accuracy / savings on threads of labelled turns:
+
+    python topic_router.py history.jsonl --eval threads.jsonl    # threads.jsonl: [{"message", "topic"}, ...] per line
+"""
+import argparse
+import json
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class TopicRouter:
+    """Sticky + nearest-centroid tiers in front of the orchestrator's LLM router."""
+
+    def __init__(self, embed_fn: Callable[[str], list[float]], min_similarity: float = 0.5, min_margin: float = 0.1,
+                 sticky_margin: float = 0.05):
+        self.embed_fn = embed_fn
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.sticky_margin = sticky_margin
+        self.topics = []
+        self.centroids = None
+        self._lock = threading.Lock()
+        self._stats = {"turns": 0, "sticky": 0, "classifier": 0, "llm": 0, "llm_checked": 0, "llm_agreed": 0}
+
+    def fit(self, messages: list[str], topics: list[str], embeddings: Optional[list[list[float]]] = None):
+        vectors = _normalize(np.asarray(embeddings if embeddings is not None else [self.embed_fn(m) for m in messages],
+                                        dtype=np.float32))
+        self.topics = sorted(set(topics))
+        labels = np.asarray(topics)
+        self.centroids = _normalize(np.stack([vectors[labels == topic].mean(axis=0) for topic in self.topics]))
+        return self
+
+    @classmethod
+    def from_jsonl(cls, path: str, embed_fn: Callable[[str], list[float]], **kwargs) -> "TopicRouter":
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return cls(embed_fn, **kwargs).fit([r["message"] for r in records], [r["topic"] for r in records])
+
+    def scores(self, message: str) -> dict:
+        vector = _normalize(np.asarray(self.embed_fn(message), dtype=np.float32)[None, :])[0]
+        return dict(zip(self.topics, (self.centroids @ vector).tolist()))
+
+    def classify(self, message: str, previous_topic: Optional[str] = None) -> tuple[Optional[str], str, Optional[str]]:
+        """Returns (topic or None, tier, best classifier guess). Before `fit` every turn goes to the LLM tier."""
+        if self.centroids is None:
+            return None, "llm", None
+        scores = self.scores(message)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best = ranked[0]
+        runner_up = scores[ranked[1]] if len(ranked) > 1 else -1.0
+        if previous_topic in scores and scores[previous_topic] >= self.min_similarity \
+                and scores[best] - scores[previous_topic] <= self.sticky_margin:
+            return previous_topic, "sticky", best
+        if scores[best] >= self.min_similarity and scores[best] - runner_up >= self.min_margin:
+            return best, "classifier", best
+        return None, "llm", best
+
+    def route(self, message: str, previous_topic: Optional[str] = None) -> tuple[Optional[str], Optional[str]]:
+        """Returns (topic, guess); topic is None when the LLM router has to decide. Pass the LLM's
+        choice for that turn to `record_llm` with the guess to track how often the classifier agrees."""
+        topic, tier, guess = self.classify(message, previous_topic)
+        with self._lock:
+            self._stats["turns"] += 1
+            self._stats[tier] += 1
+        return topic, guess
+
+    def record_llm(self, guess: Optional[str], llm_topic: str):
+        with self._lock:
+            self._stats["llm_checked"] += 1
+            self._stats["llm_agreed"] += int(guess == llm_topic)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["llm_calls_saved"] = stats["sticky"] + stats["classifier"]
+        stats["saved_rate"] = stats["llm_calls_saved"] / stats["turns"] if stats["turns"] else 0.0
+        # agreement with the LLM on the turns the classifier was not confident about
+        stats["llm_agreement"] = stats["llm_agreed"] / stats["llm_checked"] if stats["llm_checked"] else None
+        return stats
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def evaluate(router: TopicRouter, threads: list[list[dict]]) -> dict:
+    """Replays labelled threads turn by turn (the previous topic is the labelled one, as the LLM
+    tier would have set it) and reports accuracy of the fast tiers and the share of LLM calls saved."""
+    counts = {"sticky": [0, 0], "classifier": [0, 0], "llm": [0, 0]}
+    for thread in threads:
+        previous = None
+        for turn in thread:
+            topic, tier, guess = router.classify(turn["message"], previous)
+            counts[tier][0] += 1
+            counts[tier][1] += int((topic or guess) == turn["topic"])
+            previous = turn["topic"]
+    turns = sum(total for total, _ in counts.values())
+    fast = counts["sticky"][0] + counts["classifier"][0]
+    fast_correct = counts["sticky"][1] + counts["classifier"][1]
+    return {"turns": turns,
+            "llm_calls_saved": fast,
+            "saved_rate": fast / turns if turns else 0.0,
+            "fast_path_accuracy": fast_correct / fast if fast else None,
+            **{f"{tier}_turns": total for tier, (total, _) in counts.items()},
+            **{f"{tier}_accuracy": correct / total if total else None for tier, (total, correct) in counts.items()}}
+
+
+if __name__ == "__main__":
+    from langchain_ollama import OllamaEmbeddings
+
+    parser = argparse.ArgumentParser(description="Fit the topic router on labelled history and evaluate it.")
+    parser.add_argument("history", help="JSONL of {message, topic}")
+    parser.add_argument("--eval", required=True, help="JSONL, one thread (list of {message, topic}) per line")
+    parser.add_argument("--min-similarity", type=float, default=0.5)
+    parser.add_argument("--min-margin", type=float, default=0.1)
+    parser.add_argument("--sticky-margin", type=float, default=0.05)
+    args = parser.parse_args()
+
+    router = TopicRouter.from_jsonl(args.history, OllamaEmbeddings(model="mxbai-embed-large").embed_query,
+                                    min_similarity=args.min_similarity, min_margin=args.min_margin,
+                                    sticky_margin=args.sticky_margin)
+    with open(args.eval) as f:
+        threads = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(evaluate(router, threads)))
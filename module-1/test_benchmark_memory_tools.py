@@ -0,0 +1,43 @@
+import types
+
+import numpy as np
+
+from benchmark_memory_tools import HashEmbeddings, build_indexes, run_latency, run_recall
+from context_assembler import ContextAssembler
+from mmap_index import LazyIndex
+from snippets import render_past_example
+
+CORPUS = [{"id": "t1", "store": "fd", "text": "enable international payments", "metadata": {"answer": "settings"}},
+          {"id": "t2", "store": "fd", "text": "refund not received", "metadata": {"answer": "wait 7 days"}},
+          {"id": "t3", "store": "fd", "text": "change contact name", "metadata": {"answer": "profile page"}}]
+
+
+def test_hash_embeddings_are_deterministic_unit_vectors():
+    embedder = HashEmbeddings(dim=64)
+    vector = embedder.embed_query("enable international payments")
+    assert vector == HashEmbeddings(dim=64).embed_query("enable international payments")
+    assert abs(np.linalg.norm(vector) - 1.0) < 1e-6
+
+
+def test_build_indexes_skips_stores_without_records(tmp_path):
+    paths = build_indexes(CORPUS, HashEmbeddings(dim=64), str(tmp_path))
+    assert list(paths) == ["fd"]
+
+
+def test_recall_is_measured_on_what_the_assembler_returns(tmp_path):
+    embedder = HashEmbeddings(dim=64)
+    paths = build_indexes(CORPUS, embedder, str(tmp_path))
+    tools = types.SimpleNamespace(fd_store=LazyIndex(paths["fd"], embedder, mmap_path=paths["fd"]), embeddings=embedder,
+                                  past_example_assembler=ContextAssembler(render_past_example, max_distance=None),
+                                  PAST_EXAMPLE_HEADER="")
+    labelled = [{"query": "enable international payments", "relevant_ids": ["t1"]},
+                {"query": "refund not received", "relevant_ids": ["t2", "unknown"]}]
+    assert run_recall(tools, "fd", 5, labelled, {"t1", "t2", "t3"}) == {"k": 5, "recall@5": 1.0, "labelled_queries": 2}
+    # hits past the tool's cutoff are not returned, so they do not count
+    tools.past_example_assembler.max_distance = -1.0
+    assert run_recall(tools, "fd", 5, labelled, {"t1", "t2", "t3"})["recall@5"] == 0.0
+
+
+def test_run_latency_reports_percentiles():
+    report = run_latency(lambda query, thought: query.upper(), ["a", "b", "c", "d"], concurrency=2)
+    assert report["requests"] == 4 and report["p50_ms"] <= report["p99_ms"] and report["throughput_qps"] > 0
@@ -0,0 +1,27 @@
+import numpy as np
+
+from build_quantized_index import build_index, default_factories, evaluate, recall_at_k
+
+
+def test_default_factories_fit_corpus_and_dimension():
+    assert default_factories(10_000, 1024) == ["IVF400,Flat", "IVF400,PQ64", "PQ64"]
+    assert default_factories(4, 12) == ["IVF8,Flat", "IVF8,PQ4", "PQ4"]
+
+
+def test_recall_at_k():
+    assert recall_at_k(np.array([[1, 2], [3, 4]]), np.array([[2, 1], [3, 5]]), 2) == 0.75
+
+
+def test_evaluate_reports_flat_baseline_and_nprobe_sweep():
+    vectors = np.random.default_rng(0).normal(size=(600, 16)).astype(np.float32)
+    reports = list(evaluate(vectors, ["IVF8,Flat"], [1, 8], k=5, holdout=50))
+    assert [(r["factory"], r["nprobe"]) for r in reports] == [("Flat", None), ("IVF8,Flat", 1), ("IVF8,Flat", 8)]
+    # probing every list of a flat IVF is exact
+    assert reports[2]["recall"] == 1.0 and reports[1]["recall"] <= reports[2]["recall"]
+
+
+def test_build_index_keeps_row_order():
+    vectors = np.random.default_rng(1).normal(size=(300, 8)).astype(np.float32)
+    index = build_index("IVF4,Flat", vectors, nprobe=4)
+    _, rows = index.search(vectors[:5], 1)
+    assert rows[:, 0].tolist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+
+from context_assembler import ContextAssembler
+from snippets import render_human_instruction, with_snippet
+
+
+def doc(doc_id, text):
+    return with_snippet(Document(page_content=text, id=doc_id), render_human_instruction)
+
+
+def ids(docs):
+    return [d.id for d in docs]
+
+
+def test_distance_cutoff_and_near_duplicates():
+    assembler = ContextAssembler(render_human_instruction, max_distance=1.0)
+    results = [(doc("a", "enable international payments from the dashboard settings page"), 0.2),
+               (doc("b", "enable international payments from the dashboard settings page please"), 0.3),
+               (doc("c", "refund timelines for card payments"), 0.5),
+               (doc("d", "change the contact name"), 1.4)]
+    assert ids(assembler.select(results)) == ["a", "c"]
+
+
+def test_budget_keeps_the_top_hit():
+    long_text = " ".join(f"word{i}" for i in range(300))
+    results = [(doc("a", long_text), 0.1), (doc("b", "short answer"), 0.2)]
+    assert ids(ContextAssembler(render_human_instruction, token_budget=10).select(results)) == ["a"]
+    assert ids(ContextAssembler(render_human_instruction, token_budget=10_000).select(results)) == ["a", "b"]
+
+
+def test_seen_documents_are_not_repeated_across_queries():
+    assembler = ContextAssembler(render_human_instruction)
+    seen = []
+    first = assembler.select([(doc("a", "refund timelines for card payments"), 0.1)], seen=seen)
+    second = assembler.select([(doc("a", "refund timelines for card payments"), 0.1),
+                               (doc("b", "enable international payments"), 0.2)], seen=seen)
+    assert ids(first) == ["a"] and ids(second) == ["b"]
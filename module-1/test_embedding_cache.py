@@ -0,0 +1,61 @@
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), float(sum(c.isupper() for c in text))]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_keys_ignore_spacing_but_not_case():
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache(), "test-model")
+    assert embeddings.embed_query("enable  UPI autopay") == embeddings.embed_query("enable UPI autopay")
+    assert embeddings.embed_query("enable upi autopay") != embeddings.embed_query("enable UPI autopay")
+    assert model.calls == ["enable  UPI autopay", "enable upi autopay"]
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path=path)
+    cache.put("test-model", "refund status", [0.5, 0.25])
+    cache.close()
+
+    cache = EmbeddingCache(path=path)
+    assert cache.get("test-model", "refund status") == [0.5, 0.25]
+    assert cache.get("other-model", "refund status") is None
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_embed_queries_embeds_only_misses_in_one_batch():
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache(), "test-model")
+    embeddings.embed_queries(["a", "b"])
+    vectors = embeddings.embed_queries(["b", "c", "a"])
+    assert model.calls == ["a", "b", "c"]
+    assert vectors == [[1.0, 0.0], [1.0, 0.0], [1.0, 0.0]]
+
+
+def test_async_lookups_with_disk_tier(tmp_path):
+    import asyncio
+
+    class AsyncCountingEmbeddings(CountingEmbeddings):
+        async def aembed_query(self, text):
+            return self.embed_query(text)
+
+    model = AsyncCountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache(path=str(tmp_path / "embeddings.sqlite")), "test-model")
+
+    async def twice():
+        return [await embeddings.aembed_query("refund status") for _ in range(2)]
+
+    first, second = asyncio.run(twice())
+    assert first == second and model.calls == ["refund status"]
@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+
+from llama_index.core import QueryBundle
+
+from hybrid_retriever import BM25Index, HybridRetriever
+from test_resolution_ingest import WordEmbeddings
+
+TEXTS = ["How to enable international payments on the dashboard",
+         "Refund not received after seven days",
+         "Change the contact name on the account",
+         "Settlement schedule for international payments"]
+
+
+def retriever(tmp_path, **kwargs):
+    embeddings = WordEmbeddings()
+    HybridRetriever.build(str(tmp_path), TEXTS, embeddings.embed_documents(TEXTS), [{"n": i} for i in range(len(TEXTS))])
+    return HybridRetriever.load(str(tmp_path), embed_fn=embeddings.embed_query, **kwargs)
+
+
+def test_bm25_prefers_rare_matching_terms():
+    scores = BM25Index(TEXTS).scores("refund international")
+    assert scores.argmax() == 1
+    assert scores[2] == 0
+
+
+def test_retrieve_returns_text_nodes_best_first(tmp_path):
+    nodes = retriever(tmp_path, similarity_top_k=2).retrieve("enable international payments")
+    assert [node.text for node in nodes] == [TEXTS[0], TEXTS[3]]
+    assert nodes[0].score >= nodes[1].score and nodes[0].metadata == {"n": 0}
+
+
+def test_precomputed_embedding_and_sparse_only(tmp_path):
+    hybrid = retriever(tmp_path, similarity_top_k=1)
+    query = QueryBundle(query_str="refund", embedding=WordEmbeddings().embed_query("contact name account"))
+    # dense and sparse disagree; the fused ranking still lists a document matching either
+    assert hybrid.retrieve(query)[0].text in (TEXTS[1], TEXTS[2])
+    sparse_only = retriever(tmp_path / "sparse", similarity_top_k=1, alpha=0.0)
+    assert asyncio.run(sparse_only.aretrieve("refund"))[0].text == TEXTS[1]
+
+
+def test_empty_index(tmp_path):
+    HybridRetriever.build(str(tmp_path), [], np.zeros((0, WordEmbeddings.dim)))
+    assert HybridRetriever.load(str(tmp_path)).retrieve("refund") == []
@@ -0,0 +1,57 @@
+import sys
+import types
+
+import numpy as np
+
+from local_embeddings import LocalEmbeddings, MicroBatcher
+
+
+class ScaledModel:
+    """Stands in for SentenceTransformer: vectors with a norm that grows with the text length."""
+
+    def __init__(self, model_name, device="cpu", **kwargs):
+        self.encode_kwargs = []
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.encode_kwargs.append(kwargs)
+        return np.asarray([[len(text), 2.0 * len(text), 0.0] for text in texts], dtype=np.float32)
+
+
+def _local_embeddings(monkeypatch, **kwargs):
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=ScaledModel))
+    return LocalEmbeddings("test-model", max_wait_ms=1, **kwargs)
+
+
+def test_embeddings_are_unit_norm(monkeypatch):
+    embeddings = _local_embeddings(monkeypatch, encode_kwargs={"task": "retrieval.query"})
+    try:
+        vectors = [embeddings.embed_query("enable international payments"), *embeddings.embed_documents(["a", "refund"])]
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-6)
+        assert embeddings.model.encode_kwargs[0] == {"task": "retrieval.query"}
+    finally:
+        embeddings.close()
+
+
+def test_normalize_can_be_turned_off(monkeypatch):
+    embeddings = _local_embeddings(monkeypatch, normalize=False)
+    try:
+        assert embeddings.embed_documents(["ab"]) == [[2.0, 4.0, 0.0]]
+    finally:
+        embeddings.close()
+
+
+def test_micro_batcher_coalesces_concurrent_items():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [2 * item for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(i) for i in range(6)]
+        assert [f.result() for f in futures] == [0, 2, 4, 6, 8, 10]
+        assert sorted(sum(batches, [])) == list(range(6)) and max(len(b) for b in batches) <= 4
+        assert batcher.stats()["batches"] < 6
+    finally:
+        batcher.close()
@@ -0,0 +1,60 @@
+import asyncio
+import gc
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from mmap_index import LazyIndex, MmapIndex, write_mmap_index
+from test_resolution_ingest import WordEmbeddings
+
+
+def random_index(path, n=50, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    write_mmap_index(str(path), vectors, [Document(page_content=f"doc {i}", metadata={"i": i}) for i in range(n)],
+                     [f"id{i}" for i in range(n)])
+    return vectors
+
+
+def test_search_matches_faiss_flat_l2(tmp_path):
+    vectors = random_index(tmp_path)
+    queries = np.random.default_rng(1).normal(size=(4, vectors.shape[1])).astype(np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    expected_distances, expected_rows = exact.search(queries, 5)
+
+    index = MmapIndex(str(tmp_path))
+    distances, rows = index.search_by_vectors(queries, 5)
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-4)
+    doc, _ = index.similarity_search_with_score_by_vector(queries[0], k=1)[0]
+    assert doc.id == f"id{expected_rows[0][0]}" and doc.metadata == {"i": int(expected_rows[0][0])}
+
+
+def test_empty_index(tmp_path):
+    write_mmap_index(str(tmp_path), np.zeros((0, 8), dtype=np.float32), [])
+    index = MmapIndex(str(tmp_path))
+    assert index.count == 0
+    assert index.search_documents(np.ones((2, 8)), 3) == [[], []]
+
+
+def test_lazy_index_batch_and_async_search(tmp_path):
+    random_index(tmp_path, dim=WordEmbeddings.dim)
+    store = LazyIndex(str(tmp_path / "faiss"), WordEmbeddings(), mmap_path=str(tmp_path))
+    queries = np.random.default_rng(2).normal(size=(3, WordEmbeddings.dim))
+    batch = store.similarity_search_with_score_by_vectors(queries, k=4)
+    assert [[doc.id for doc, _ in hits] for hits in batch] == \
+        [[doc.id for doc, _ in store.similarity_search_with_score_by_vector(q, k=4)] for q in queries]
+    hits = asyncio.run(store.asimilarity_search_with_score_by_vector(queries[0], k=4))
+    assert [doc.id for doc, _ in hits] == [doc.id for doc, _ in batch[0]]
+
+
+def test_reload_keeps_running_searches_working(tmp_path):
+    random_index(tmp_path)
+    store = LazyIndex(str(tmp_path / "faiss"), None, mmap_path=str(tmp_path))
+    index = store.index
+    store.reload()
+    gc.collect()
+    # a search that still holds the old index can finish
+    assert index.document(0).id == "id0"
+    assert store.generation == 1 and store.index is not index
@@ -0,0 +1,54 @@
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery
+
+from pinecone_ingest import BulkIngestPipeline
+
+DOCUMENTS = [{"id": f"doc{i}", "text": f"Policy {i}: refunds are processed within {i + 1} days.", "metadata": {"n": i}}
+             for i in range(5)]
+
+
+class FlakyStore(SimpleVectorStore):
+    """Local stand-in for the Pinecone store whose first `failures` upserts raise, like a rate limit."""
+
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(**kwargs)
+        self._failures = failures
+
+    def add(self, nodes, **kwargs):
+        if self._failures:
+            self._failures -= 1
+            raise RuntimeError("429 too many requests")
+        return super().add(nodes, **kwargs)
+
+
+def pipeline(store, checkpoint, **kwargs):
+    return BulkIngestPipeline(store, MockEmbedding(embed_dim=8), checkpoint_path=checkpoint, batch_size=2,
+                              concurrency=2, backoff_seconds=0, **kwargs)
+
+
+def test_ingests_every_chunk_with_embeddings(tmp_path):
+    store = SimpleVectorStore()
+    stats = pipeline(store, str(tmp_path / "ingest.ckpt")).run(DOCUMENTS)
+    assert stats["nodes"] == 5 and stats["batches"] == 3 and stats["failed_batches"] == 0
+    result = store.query(VectorStoreQuery(query_embedding=[0.5] * 8, similarity_top_k=10))
+    assert sorted(result.ids) == [f"doc{i}#0" for i in range(5)]
+
+
+def test_retries_then_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "ingest.ckpt")
+    # retries absorb a transient failure
+    stats = pipeline(FlakyStore(failures=1), checkpoint, max_retries=2).run(DOCUMENTS)
+    assert stats["retries"] == 1 and stats["batches"] == 3
+
+    # a rerun skips the batches recorded in the checkpoint; the last one changed (doc4 + doc5)
+    store = SimpleVectorStore()
+    stats = pipeline(store, checkpoint).run(DOCUMENTS + [{"id": "doc5", "text": "New policy.", "metadata": {}}])
+    assert stats["skipped_batches"] == 2 and stats["nodes"] == 2
+
+
+def test_failed_batch_is_left_for_the_next_run(tmp_path):
+    checkpoint = str(tmp_path / "ingest.ckpt")
+    stats = pipeline(FlakyStore(failures=100), checkpoint, max_retries=1).run(DOCUMENTS[:2])
+    assert stats["failed_batches"] == 1 and stats["batches"] == 0
+    stats = pipeline(SimpleVectorStore(), checkpoint).run(DOCUMENTS[:2])
+    assert stats["batches"] == 1 and stats["skipped_batches"] == 0
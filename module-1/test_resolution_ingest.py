@@ -0,0 +1,107 @@
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from mmap_index import LazyIndex
+from resolution_ingest import ResolutionIngestor
+from semantic_cache import SemanticCache
+
+
+class WordEmbeddings(Embeddings):
+    """Bag of hashed words, unit norm; texts sharing words are close."""
+
+    dim = 64
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def ticket(ticket_id, query, answer=""):
+    return {"id": ticket_id, "query": query, "answer": answer or f"answer to {query}",
+            "derived_policies_or_process": ""}
+
+
+def search(store, query, k=5):
+    return store.similarity_search_with_score_by_vector(WordEmbeddings().embed_query(query), k=k)
+
+
+def test_cache_generation_follows_published_versions(tmp_path):
+    ingestor = ResolutionIngestor(str(tmp_path), WordEmbeddings())
+    ingestor.add([ticket("t1", "enable international payments", "old answer")])
+    store = LazyIndex(str(tmp_path / "faiss"), WordEmbeddings(), mmap_path=str(tmp_path), refresh_seconds=0)
+    cache = SemanticCache(max_items=4)
+    vector = WordEmbeddings().embed_query("enable international payments")
+
+    generation = store.current_generation()
+    cache.put(vector, search(store, "enable international payments")[0][0].metadata["answer"], generation=generation)
+    assert cache.get(vector, generation=store.current_generation()) == "old answer"
+
+    ingestor.add([ticket("t1", "enable international payments", "new answer")])
+    # a cache hit must not need a search to notice the new version
+    assert store.current_generation() == generation + 1
+    assert cache.get(vector, generation=store.current_generation()) is None
+    assert search(store, "enable international payments")[0][0].metadata["answer"] == "new answer"
+
+
+class FaissStore:
+    """What `export_faiss_store` reads from a langchain FAISS store."""
+
+    def __init__(self, tickets):
+        import faiss
+        from langchain_core.documents import Document
+
+        self.index = faiss.IndexFlatL2(WordEmbeddings.dim)
+        self.index.add(np.asarray(WordEmbeddings().embed_documents([t["query"] for t in tickets]), dtype=np.float32))
+        docs = {f"uuid-{i}": Document(page_content=t["query"], metadata={"ticket_id": t["id"], "answer": t["answer"]})
+                for i, t in enumerate(tickets)}
+        self.index_to_docstore_id = dict(enumerate(docs))
+        self.docstore = type("Docstore", (), {"search": staticmethod(docs.get)})
+
+
+def answers(store, query):
+    return [doc.metadata["answer"] for doc, _ in search(store, query)]
+
+
+def test_add_supersede_retract_compact(tmp_path):
+    ingestor = ResolutionIngestor(str(tmp_path), WordEmbeddings())
+    ingestor.bootstrap(FaissStore([ticket("t1", "enable international payments", "base t1"),
+                                   ticket("t2", "refund not received", "base t2")]))
+    store = LazyIndex(str(tmp_path / "faiss"), WordEmbeddings(), mmap_path=str(tmp_path), refresh_seconds=0)
+    assert answers(store, "enable international payments")[0] == "base t1"
+
+    # base tickets are keyed by ticket id, so they can be superseded and retracted
+    ingestor.add([ticket("t1", "enable international payments", "new t1"), ticket("t3", "change contact name")])
+    assert "base t1" not in answers(store, "enable international payments")
+    assert answers(store, "enable international payments")[0] == "new t1"
+    ingestor.retract(["t2"])
+    assert "base t2" not in answers(store, "refund not received")
+
+    manifest = ingestor.compact()
+    assert len(manifest["segments"]) == 1 and manifest["tombstones"] == {}
+    assert sorted(answers(store, "enable international payments")) == ["answer to change contact name", "new t1"]
+
+
+def test_retract_unknown_id_publishes_nothing(tmp_path):
+    ingestor = ResolutionIngestor(str(tmp_path), WordEmbeddings())
+    version = ingestor.add([ticket("t1", "enable international payments")])["version"]
+    with pytest.raises(KeyError, match="t9"):
+        ingestor.retract(["t1", "t9"])
+    assert ingestor._manifest()["version"] == version
+
+
+def test_compact_everything_retracted(tmp_path):
+    ingestor = ResolutionIngestor(str(tmp_path), WordEmbeddings())
+    ingestor.add([ticket("t1", "enable international payments")])
+    ingestor.retract(["t1"])
+    assert ingestor.compact()["segments"] == []
+    assert ingestor.add([]) == ingestor._manifest()
+    store = LazyIndex(str(tmp_path / "faiss"), WordEmbeddings(), mmap_path=str(tmp_path))
+    assert search(store, "enable international payments") == []
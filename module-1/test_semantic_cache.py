@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+from mmap_index import VECTORS_FILE, LazyIndex, MmapIndex, write_mmap_index
+from resolution_ingest import ResolutionIngestor
+from semantic_cache import SemanticCache
+from test_resolution_ingest import FaissStore, WordEmbeddings, answers, ticket
+
+
+def test_hit_within_max_distance_only():
+    cache = SemanticCache(max_items=4, max_distance=0.05)
+    cache.put([1.0, 0.0], "cached")
+    assert cache.get([2.0, 0.01]) == "cached"
+    assert cache.get([0.7, 0.7]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_generation_ttl_and_lru_eviction():
+    cache = SemanticCache(max_items=2, ttl_seconds=3600)
+    cache.put([1.0, 0.0], "a", generation=1)
+    assert cache.get([1.0, 0.0], generation=2) is None
+    cache.put([1.0, 0.0], "a", generation=2)
+    cache.put([0.0, 1.0], "b", generation=2)
+    cache.get([1.0, 0.0], generation=2)
+    cache.put([0.7, -0.7], "c", generation=2)
+    assert cache.get([0.0, 1.0], generation=2) is None
+    assert cache.get([1.0, 0.0], generation=2) == "a"
+
+    cache = SemanticCache(ttl_seconds=0)
+    cache.put([1.0, 0.0], "a")
+    assert cache.get([1.0, 0.0]) is None
+
+
+def test_rebuild_is_published_and_invalidates_cache(tmp_path):
+    mmap_dir = str(tmp_path / "index.mmap")
+    ResolutionIngestor(mmap_dir).rebuild(FaissStore([ticket("t1", "enable international payments", "build 1")]))
+    store = LazyIndex(str(tmp_path / "index"), WordEmbeddings(), mmap_path=mmap_dir, refresh_seconds=0)
+    cache = SemanticCache()
+    vector = WordEmbeddings().embed_query("enable international payments")
+    cache.put(vector, answers(store, "enable international payments"), generation=store.current_generation())
+    first_build = store.index.segments[0][1]
+
+    ResolutionIngestor(mmap_dir).rebuild(FaissStore([ticket("t1", "enable international payments", "build 2")]))
+    assert cache.get(vector, generation=store.current_generation()) is None
+    assert answers(store, "enable international payments") == ["build 2"]
+    # the first build's files were not touched while mapped
+    assert first_build.document(0).metadata["answer"] == "build 1"
+    assert os.path.exists(os.path.join(first_build.path, VECTORS_FILE))
+
+
+def test_unversioned_directory_switches_to_first_published_build(tmp_path):
+    mmap_dir = str(tmp_path / "index.mmap")
+    documents = FaissStore([ticket("t1", "refund not received", "unversioned")])
+    write_mmap_index(mmap_dir, documents.index.reconstruct_n(0, 1), [documents.docstore.search("uuid-0")])
+    store = LazyIndex(str(tmp_path / "index"), WordEmbeddings(), mmap_path=mmap_dir, refresh_seconds=0)
+    assert isinstance(store.index, MmapIndex)
+    with pytest.raises(FileExistsError):
+        write_mmap_index(mmap_dir, np.zeros((1, WordEmbeddings.dim)), [documents.docstore.search("uuid-0")])
+
+    ResolutionIngestor(mmap_dir).rebuild(FaissStore([ticket("t1", "refund not received", "published")]))
+    assert store.current_generation() == 1
+    assert answers(store, "refund not received") == ["published"]
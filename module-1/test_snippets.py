@@ -0,0 +1,28 @@
+from langchain_core.documents import Document
+
+from snippets import (HIT_NUMBER, SNIPPET_KEY, SNIPPET_TOKENS_KEY, count_tokens, get_snippet, get_snippet_tokens,
+                      render_past_example, with_snippet)
+
+TICKET = Document(page_content="How do I enable international payments?",
+                  metadata={"answer": "Enabled from settings.", "derived_policies_or_process": float("nan")})
+
+
+def test_prerendered_snippet_gets_the_hit_number():
+    doc = with_snippet(TICKET, render_past_example)
+    assert HIT_NUMBER in doc.metadata[SNIPPET_KEY]
+    snippet = get_snippet(doc, render_past_example, 3)
+    assert "Past answer by human support team 3: Enabled from settings." in snippet
+    # missing dataframe fields render empty
+    assert "Derived process or policy from this conversation 3: \n" in snippet
+    assert doc.metadata[SNIPPET_TOKENS_KEY] == count_tokens(get_snippet(doc, render_past_example, 1))
+
+
+def test_documents_without_snippet_render_at_query_time():
+    assert get_snippet(TICKET, render_past_example, 2) == get_snippet(with_snippet(TICKET, render_past_example),
+                                                                    render_past_example, 2)
+    assert get_snippet_tokens(TICKET, render_past_example) == count_tokens(get_snippet(TICKET, render_past_example, 1))
+
+
+def test_hit_number_in_source_text_is_stripped():
+    doc = Document(page_content="odd\x1ftext", metadata={})
+    assert get_snippet(doc, render_past_example, 1).startswith("oddtext\n")